@@ -1,7 +1,10 @@
 import pyvisa as visa
 from pathlib import Path
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
+from scopeparser import ScopeParser
+from scope_channel import ScopeChannel
 
 CHANNELS = ["CHAN1", "CHAN2", "CHAN3", "CHAN4"]
 
@@ -17,31 +20,58 @@ class AgilentConnection():
         print("connection opened: {}".format(self.instr.query("*IDN?")))
 
     def generate_data_df(self):
+        """ fills self.df with one column per channel, time is implicit: self.time (or self.xincr) """
         self.df = pd.DataFrame()
+        self.xincr = None
         for chan in self.channels:
-            self.instr.write(f":WAVEFORM:SOURCE {chan}")
-            print("Selected channel: {}".format(self.instr.query(":WAVEFORM:SOURCE?")), end = "")
-            self.instr.write(":WAVEFORM:FORMAT WORD")
-            self.instr.write(":WAVEFORM:TYPE NORMAL")
             try:
-                self.instr.write(":WAVEFORM:POINTS:MODE MAX")
-                # self.instr.write(":WAVEFORM:POINTS 2000000")
-                # print(self.instr.query(":WAVEFORM:POINTS?"))
-                preamble = [float(x) if "." in x or "E" in x else int(x) for x in self.instr.query(":WAV:PRE?").split(",")]
-                pre_dict = dict(zip(self.DICT_KEYS, preamble))
-                pre_dict["format"] = self.FORMAT[pre_dict["format"]] if pre_dict["format"] in self.FORMAT.keys() else pre_dict["format"]
-                pre_dict["type"] = self.TYPE[pre_dict["type"]] if pre_dict["type"] in self.TYPE.keys() else pre_dict["type"]
-                endian_big = True if "MSB" in self.instr.query(":WAV:BYT?") else False
-                data = self.instr.query_binary_values(":WAVEFORM:DATA?", is_big_endian=endian_big, datatype="H")
-                self.df[f"{chan}"] = [(x - pre_dict["yref"]) * pre_dict["yincr"] + pre_dict["yorigin"] for x in data]
-                if not "time" in self.df.index:
-                   self.df["time"] = [x * pre_dict["xincr"] for x in range(pre_dict["points"])]
+                channel = self._read_channel(chan)
+                self.df[f"{chan}"] = channel.values
+                self.xincr = channel.header["xincr"]
             except visa.VisaIOError:
                 print(f"Error loading {chan}")
             else:
                 print(f"{chan} loaded correctly")
         # return self.df
 
+    def acquire(self, *args, **kwargs):
+        """
+        Acquires the channels straight into a ScopeParser-object: binary transfer into NumPy arrays (raw codes + preamble)
+
+        Args:
+            kwargs are passed to the ScopeParser-object (rms, avg, rename_dict, ...)
+
+        Returns:
+            ScopeParser-object
+        """
+        channels = dict()
+        for chan in self.channels:
+            channels[chan] = self._read_channel(chan)
+        xincr = next(iter(channels.values())).header["xincr"]
+        return ScopeParser.from_dict(channels, xincr, *args, **kwargs)
+
+    def _read_channel(self, chan):
+        """ return ScopeChannel(chan) with the raw codes and the preamble as header """
+        self.instr.write(f":WAVEFORM:SOURCE {chan}")
+        print("Selected channel: {}".format(self.instr.query(":WAVEFORM:SOURCE?")), end = "")
+        self.instr.write(":WAVEFORM:FORMAT WORD")
+        self.instr.write(":WAVEFORM:TYPE NORMAL")
+        self.instr.write(":WAVEFORM:POINTS:MODE MAX")
+        # self.instr.write(":WAVEFORM:POINTS 2000000")
+        # print(self.instr.query(":WAVEFORM:POINTS?"))
+        preamble = [float(x) if "." in x or "E" in x else int(x) for x in self.instr.query(":WAV:PRE?").split(",")]
+        pre_dict = dict(zip(self.DICT_KEYS, preamble))
+        pre_dict["format"] = self.FORMAT[pre_dict["format"]] if pre_dict["format"] in self.FORMAT.keys() else pre_dict["format"]
+        pre_dict["type"] = self.TYPE[pre_dict["type"]] if pre_dict["type"] in self.TYPE.keys() else pre_dict["type"]
+        endian_big = True if "MSB" in self.instr.query(":WAV:BYT?") else False
+        data = self.instr.query_binary_values(":WAVEFORM:DATA?", is_big_endian=endian_big, datatype="H", container=np.array)
+        return ScopeChannel(chan, data, pre_dict, pre_dict["yincr"], pre_dict["yref"], pre_dict["yorigin"])
+
+    @property
+    def time(self):
+        """ time data of the traces in self.df, generated on every access out of the sample interval """
+        return np.arange(len(self.df)) * self.xincr
+
     def save_screen_png(self, name):
         self.instr.write("")
 
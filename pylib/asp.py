@@ -1,11 +1,65 @@
 import re
-import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
 import os
 import glob
-
-# added because of annoying GLib warning in matplotlib (savefig)
-import warnings
-warnings.simplefilter("ignore")
+from scope_functions import first_order_filter
+from asp_plot import plotter, render_parallel
+
+# ALC sample token "bit/strength" in an rx dump
+ALC_SAMPLE = re.compile(r"[0-1]/.")
+ALC_KINDS = {"0": 0, "1": 1}
+
+
+def parse_rx_dump(data, useless=None):
+    """
+    Parses an rx dump once: every ALC sample ("bit/strength") into arrays, the adc lines into lists
+
+    Args:
+        data (str): content of the rx dump
+        useless (callable): called with every line that is no ALC or adc line (e.g. to print a warning)
+
+    Returns:
+        dict: bits (int64, -1 if the bit is no number), kind (int8, 0 or 1 for the strength arrays, else -1),
+            strength (int64), adc_50 and adc_rx (list of lines, lines longer than 400 samples are 50Hz lines),
+            alc_data (tokens of the last ALC line)
+    """
+    alc_data = []
+    bits = []
+    kinds = []
+    strengths = []
+    adc_50 = []
+    adc_rx = []
+
+    for line in data.split("\n"):
+        line.rstrip()
+        if "/" in line:
+            temp = line.split(" ")
+            alc_data = temp
+            for x in temp:
+                if ALC_SAMPLE.search(x):
+                    y = x.split("/")
+                    strengths.append(int(y[1]))
+                    try:
+                        bits.append(int(y[0]))
+                    except ValueError:
+                        bits.append(-1)
+                    # only "0" and "1" count as bit value for the strength arrays
+                    kinds.append(ALC_KINDS.get(y[0], -1))
+        elif "," in line:
+            try:
+                temp_data = [int(x) for x in line.split(",")]
+                temp_data.pop(len(temp_data)-1)
+                if len(temp_data) > 400:
+                    adc_50.append(temp_data)
+                else:
+                    adc_rx.append(temp_data)
+            except:
+                pass
+        elif useless is not None:
+            useless(line)
+    return dict(alc_data=alc_data, bits=np.array(bits, dtype=np.int64), kind=np.array(kinds, dtype=np.int8),
+                strength=np.array(strengths, dtype=np.int64), adc_50=adc_50, adc_rx=adc_rx)
 
 
 class Params:
@@ -46,47 +100,33 @@ class Rx:
         self.reload_alc_data(data)
 
     def reload_alc_data(self, data):
+        """ parses the rx dump once (parse_rx_dump), the threshold is applied as a mask on access """
         self._data = data
-        self._alc_data = []
-        self._adc_data_rx = []
-        self._adc_data_50 = []
-        self.alc_bit_array = []
-        self.alc_strength_array_1 = []
-        self.alc_strength_array_0 = []
-        self.alc_noise_array = []
-
-        for line in self._data.split("\n"):
-            line.rstrip()
-            if "/" in line:
-                temp = line.split(" ")
-                self._alc_data = temp
-                for x in temp:
-                    if re.search(r"[0-1]/.", x):
-                        y = x.split("/")
-                        if int(y[1]) < self.threshold_level:
-                            self.alc_noise_array.append(int(y[1]))
-                        else:
-                            self.alc_bit_array.append(int(y[0]))
-                            if y[0] == "0":
-                                self.alc_strength_array_0.append(int(y[1]))
-                            elif y[0] == "1":
-                                self.alc_strength_array_1.append(int(y[1]))
-                            else:
-                                continue
-            elif "," in line:
-                try:
-                    temp_data = list(map(lambda x: int(x), line.split(",")))
-                    temp_data.pop(len(temp_data)-1)
-                    if len(temp_data) > 400:
-                        self._adc_data_50.append(temp_data)
-                    elif len(temp_data) <= 400:
-                        self._adc_data_rx.append(temp_data)
-                    else:
-                        continue
-                except:
-                    pass
-            else:
-                print(f"Useless line in command rx {self._arg1} {self._arg2}")
+        res = parse_rx_dump(data, lambda line: print(f"Useless line in command rx {self._arg1} {self._arg2}"))
+        self._alc_data = res["alc_data"]
+        self._alc_bits = res["bits"]
+        self._alc_kind = res["kind"]
+        self._alc_strength = res["strength"]
+        self._adc_data_50 = self._adc_lines(res["adc_50"])
+        self._adc_data_rx = self._adc_lines(res["adc_rx"])
+
+    # ALC samples above/below the threshold level (masks on the parsed arrays)
+
+    @property
+    def alc_noise_array(self):
+        return self._alc_strength[self._alc_strength < self.threshold_level]
+
+    @property
+    def alc_bit_array(self):
+        return self._alc_bits[self._alc_strength >= self.threshold_level]
+
+    @property
+    def alc_strength_array_0(self):
+        return self._alc_strength[(self._alc_strength >= self.threshold_level) & (self._alc_kind == 0)]
+
+    @property
+    def alc_strength_array_1(self):
+        return self._alc_strength[(self._alc_strength >= self.threshold_level) & (self._alc_kind == 1)]
 
     def plot_adc_data_50(self, line_nr):
         # line_nr is starting from 1, not 0
@@ -96,13 +136,11 @@ class Rx:
         return self._plot_data(line_nr, self._adc_data_rx, "hf")
 
     def print_filter_value_50(self):
+        """ first order filter (alpha 220/256) of the first 50Hz line, rounded to 3 decimals """
         res = []
         try:
-            y = self._adc_data_50[0][0]
-            for x in range(len(self._adc_data_50[0])):
-                y = round((self._adc_data_50[0][x]
-                           * (256-220) + y * 220) / 256, 3)
-                res.append(y)
+            y = first_order_filter(np.asarray(self._adc_data_50[0], dtype=np.float64), 220 / 256)[0]
+            res = np.round(y, 3).tolist()
         except IndexError:
             "Something wrong with input"
         return res
@@ -117,30 +155,52 @@ class Rx:
             Exception("No filter data available")
         return tot
 
-    def plot_adc_data_50_all(self):
-        tot = []
-        try:
-            for i in range(len(self._adc_data_50)):
-                x = self._plot_data((i), self._adc_data_50, 50)
-                tot.append(x)
-        except:
-            Exception("No 50Hz data available")
-        return tot
+    def plot_adc_data_50_all(self, workers=None):
+        """ plots every 50Hz line, workers: number of worker processes (None: all plots in this process) """
+        return self._plot_all(self._adc_data_50, 50, workers)
 
-    def plot_adc_data_hf_all(self):
-        tot = []
-        try:
-            for i in range(len(self._adc_data_rx)):
-                x = self._plot_data((i), self._adc_data_rx, "hf")
-                tot.append(x)
-        except:
-            Exception("No hf data available")
-        return tot
+    def plot_adc_data_hf_all(self, workers=None):
+        """ plots every hf line, workers: number of worker processes (None: all plots in this process) """
+        return self._plot_all(self._adc_data_rx, "hf", workers)
+
+    def plot_adc_data_file(self, type=50, multipage=True, columns=2):
+        """ all 50Hz (type 50) or hf (type "hf") lines in one file: a pdf with one page per line (multipage)
+            or a png with one panel per line (columns panels wide), returns the name of the file """
+        array = self._adc_data_50 if type == 50 else self._adc_data_rx
+        if len(array) == 0:
+            return "selected file has no adc data"
+        name = self._plot_name("all", type)
+        jobs = [(array[i], f"{os.path.basename(name)} line {i + 1}") for i in range(len(array))]
+        if multipage:
+            return plotter().render_pages(jobs, f"{name}.pdf")
+        return plotter().render_panels(jobs, f"{name}.png", columns)
 
     def return_alc_dict(self):
         return dict(threshold=self.threshold_level, count_noise=self.get_noise_count(), avg_noise=self.get_avg_noise(), avg_0=self.get_avg_alc_strength_0(),
                     avg_1=self.get_avg_alc_strength_1(), count_0=self.get_0_count(), count_1=self.get_1_count(), max_0=self.get_max_alc_0(), max_1=self.get_max_alc_1())
 
+    def threshold_sweep(self, thresholds=None):
+        """ return_alc_dict statistics for every candidate threshold at once (defaults to all 4096 adc levels)
+            strengths are sorted once per statistic, counts/sums per threshold follow from searchsorted + cumulative sums
+            returns pd.DataFrame indexed by threshold (NaN where return_alc_dict gives None) """
+        thresholds = np.arange(4096) if thresholds is None else np.asarray(thresholds)
+        # noise: strength below the threshold
+        count_noise, total = self._sweep_below(np.sort(self._alc_strength), thresholds)
+        res = {"count_noise": count_noise, "avg_noise": self._sweep_average(total, count_noise, 1)}
+        # bits: strength at or above the threshold
+        stats = dict()
+        for bit in [0, 1]:
+            values = np.sort(self._alc_strength[self._alc_kind == bit])
+            count, total = self._sweep_below(values, thresholds)
+            count = len(values) - count
+            stats[f"avg_{bit}"] = self._sweep_average(int(values.sum()) - total, count, 0)
+            stats[f"max_{bit}"] = np.where(count > 0, values[-1] if len(values) else 0, np.nan)
+            values = np.sort(self._alc_strength[self._alc_bits == bit])
+            stats[f"count_{bit}"] = len(values) - np.searchsorted(values, thresholds, side="left")
+        for k in ["avg_0", "avg_1", "count_0", "count_1", "max_0", "max_1"]:
+            res[k] = stats[k]
+        return pd.DataFrame(res, index=pd.Index(thresholds, name="threshold"))
+
     def __str__(self):
         return f"""
         Treshold level used: {self.threshold_level}
@@ -158,16 +218,18 @@ class Rx:
         return self.alc_strength_array_0
 
     def get_max_alc_0(self):
-        try:
-            return max(self.alc_strength_array_0)
-        except Exception:
+        array = self.alc_strength_array_0
+        if len(array) == 0:
             "There was not ALC value above the threshold level"
+            return None
+        return int(array.max())
 
     def get_max_alc_1(self):
-        try:
-            return max(self.alc_strength_array_1)
-        except Exception:
+        array = self.alc_strength_array_1
+        if len(array) == 0:
             "There was not ALC value above the threshold level"
+            return None
+        return int(array.max())
 
     def get_noise_array(self):
         return self.alc_noise_array
@@ -176,10 +238,10 @@ class Rx:
         return self.alc_bit_array
 
     def get_0_count(self):
-        return self.alc_bit_array.count(0)
+        return int(np.count_nonzero(self.alc_bit_array == 0))
 
     def get_1_count(self):
-        return self.alc_bit_array.count(1)
+        return int(np.count_nonzero(self.alc_bit_array == 1))
 
     def get_avg_alc_strength_1(self):
         return self._average_array(self.alc_strength_array_1, 0)
@@ -191,7 +253,7 @@ class Rx:
         return self._average_array(self.alc_noise_array, 1)
 
     def get_noise_count(self):
-        return len(self.alc_noise_array)
+        return int(np.count_nonzero(self._alc_strength < self.threshold_level))
 
     def get_alc_threshold_level(self):
         return self.threshold_level
@@ -199,38 +261,60 @@ class Rx:
     # SETTERS
 
     def set_alc_threshold_level(self, thr):
+        # no reparse: the threshold is applied as a mask on the parsed arrays
         self.threshold_level = thr
-        self.reload_alc_data(self._data)
         return self.threshold_level
 
     # Private functions
 
     def _average_array(self, array, rounding):
-        try:
-            return round(sum(array)/len(array), rounding)
-        except ZeroDivisionError:
+        if len(array) == 0:
             "The array passed to the function has no data in it"
+            return None
+        return round(int(np.sum(array)) / len(array), rounding)
+
+    @staticmethod
+    def _sweep_below(strength, thresholds):
+        """ return [count, sum] of the (sorted) strengths below every threshold """
+        prefix = np.concatenate(([0], np.cumsum(strength)))
+        count = np.searchsorted(strength, thresholds, side="left")
+        return [count, prefix[count]]
+
+    @staticmethod
+    def _sweep_average(total, count, rounding):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.round(np.where(count > 0, total / np.maximum(count, 1), np.nan), rounding)
+
+    @staticmethod
+    def _adc_lines(lines):
+        """ (lines, samples) array when all lines have the same length, else a list of arrays """
+        if len(lines) == 0:
+            return np.empty((0, 0), dtype=np.int64)
+        if len(set(len(x) for x in lines)) == 1:
+            return np.array(lines, dtype=np.int64).reshape(len(lines), -1)
+        return [np.array(x, dtype=np.int64) for x in lines]
+
+    def _plot_all(self, array, type, workers=None):
+        # line numbers as given by the original loop (0 up to the number of lines - 1)
+        jobs = [(array[i - 1], self._plot_name(i, type)) for i in range(len(array))]
+        if workers is None:
+            return plotter().render_all(jobs)
+        return render_parallel(jobs, workers)
+
+    def _plot_name(self, line_nr, type):
+        test = ""
+        if self.test_mode:
+            test = "test/"
+        return f"{test}plots/plot_{type}_l{line_nr}_{str(id(self))[-7:-1]}"
 
     def _plot_data(self, line_nr, array, type):
-        if array == []:
+        """ plots line line_nr (starting from 1) of array on the shared Agg figure of asp_plot """
+        if len(array) == 0:
             return "selected file has no adc data"
-        elif len(array) < line_nr and array != []:
+        elif len(array) < line_nr:
             return "no line available for this number"
         else:
-            test = ""
-            if self.test_mode:
-                test = "test/"
-            name = f"{test}plots/plot_{type}_l{line_nr}_{str(id(self))[-7:-1]}"
-            plt.plot(array[line_nr-1])
-            plt.title(f"{os.path.basename(name)}", color="#FF0000")
-            plt.ylim((-50, 4146))
-            plt.xlabel("Sample Number")
-            plt.ylabel("ADC value")
-            plt.grid()
-            # plt.summer()
-            plt.savefig(name)
-            plt.close()
-            return name
+            return plotter().render(array[line_nr-1], self._plot_name(line_nr, type))
 
 
 def main():
@@ -0,0 +1,179 @@
+""" Dataset of many rx dumps (data_rx_<arg1>_<arg2> files): all ALC samples and adc lines of all runs in one
+    columnar table tagged with run, arg1 and arg2, statistics and histograms are vectorized group-by's over the runs """
+import logging
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from asp import parse_rx_dump
+
+ALC_COLUMNS = ["run", "arg1", "arg2", "sample", "bit", "kind", "strength"]
+ADC_COLUMNS = ["run", "arg1", "arg2", "type", "line", "sample", "value"]
+
+
+class RxDataset():
+    """ ALC samples (alc) and adc samples (adc) of many rx dumps, one row per sample """
+
+    def __init__(self, alc, adc, errors=None):
+        """
+        Args:
+            alc (pd.DataFrame): one row per ALC sample, columns run, arg1, arg2, sample, bit, kind, strength
+            adc (pd.DataFrame): one row per adc sample, columns run, arg1, arg2, type ("50" or "hf"), line, sample, value
+            errors (dict): run: exception of the dumps that could not be parsed
+        """
+        self.alc = alc
+        self.adc = adc
+        self.errors = errors if errors else dict()
+
+    @classmethod
+    def from_directory(cls, path, pattern="data_rx_*", workers=None):
+        """
+        Parses every rx dump in a directory in a pool of worker processes
+
+        Args:
+            path (Path(Windows or Posix)): relative or absolute path of the directory
+            pattern (str): glob pattern of the rx dumps, arg1 and arg2 are taken from the name (data_rx_<arg1>_<arg2>)
+            workers (int): number of worker processes (defaults to the number of cores)
+
+        Returns:
+            RxDataset-object: runs are ordered by name, dumps that fail are logged and kept in errors
+        """
+        files = sorted(f for f in Path(path).resolve().glob(pattern) if f.is_file())
+        parsed = dict()
+        errors = dict()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_load_dump, file): file.name for file in files}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    parsed[name] = future.result()
+                except Exception as e:
+                    logging.warning(f"{name} could not be parsed: {e!r}")
+                    errors[name] = e
+        return cls.from_dumps([(name, parsed[name]) for name in sorted(parsed)], errors)
+
+    @classmethod
+    def from_dumps(cls, dumps, errors=None):
+        """ RxDataset of dumps: iterable of (name, parse_rx_dump result with arg1 and arg2) """
+        alc = {k: [] for k in ALC_COLUMNS}
+        adc = {k: [] for k in ADC_COLUMNS}
+        names = []
+        for run, (name, dump) in enumerate(dumps):
+            names.append(name)
+            n = len(dump["strength"])
+            alc["run"].append(np.full(n, run, dtype=np.int32))
+            alc["arg1"].append(np.full(n, dump["arg1"]))
+            alc["arg2"].append(np.full(n, dump["arg2"]))
+            alc["sample"].append(np.arange(n, dtype=np.int64))
+            alc["bit"].append(dump["bits"])
+            alc["kind"].append(dump["kind"])
+            alc["strength"].append(dump["strength"])
+            for adc_type, lines in [("50", dump["adc_50"]), ("hf", dump["adc_rx"])]:
+                lengths = np.array([len(x) for x in lines], dtype=np.int64)
+                total = int(lengths.sum())
+                adc["run"].append(np.full(total, run, dtype=np.int32))
+                adc["arg1"].append(np.full(total, dump["arg1"]))
+                adc["arg2"].append(np.full(total, dump["arg2"]))
+                adc["type"].append(np.full(total, adc_type))
+                # line numbers start from 1 (as Rx.plot_adc_data_50)
+                adc["line"].append(np.repeat(np.arange(1, len(lines) + 1), lengths))
+                adc["sample"].append(np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths))
+                adc["value"].append(np.array([v for x in lines for v in x], dtype=np.int64))
+        return cls(cls._table(alc, names), cls._table(adc, names, ["type"]), errors)
+
+    @property
+    def runs(self):
+        """ pd.DataFrame, one row per run: arg1, arg2 and the number of ALC samples """
+        return self.alc.groupby("run", observed=True).agg(arg1=("arg1", "first"), arg2=("arg2", "first"),
+                                                          samples=("strength", "size"))
+
+    def stats(self, threshold=100, by=["arg1", "arg2"]):
+        """
+        Rx.return_alc_dict statistics of every group of runs
+
+        Args:
+            threshold (int): ALC threshold level, strengths below it are noise
+            by (list): columns to group by ("run" for the statistics of every single dump)
+
+        Returns:
+            pd.DataFrame: index by, columns threshold, count_noise, avg_noise, avg_0, avg_1, count_0, count_1, max_0, max_1
+                (NaN where Rx.return_alc_dict gives None)
+        """
+        strength = self.alc["strength"].to_numpy()
+        noise = strength < threshold
+        table = self.alc[by].copy()
+        table["count_noise"] = noise
+        table["avg_noise"] = np.where(noise, strength, np.nan)
+        for bit in [0, 1]:
+            above = ~noise & (self.alc["kind"].to_numpy() == bit)
+            table[f"avg_{bit}"] = np.where(above, strength, np.nan)
+            table[f"max_{bit}"] = table[f"avg_{bit}"]
+            table[f"count_{bit}"] = ~noise & (self.alc["bit"].to_numpy() == bit)
+        res = table.groupby(by, observed=True).agg(
+            count_noise=("count_noise", "sum"), avg_noise=("avg_noise", "mean"), avg_0=("avg_0", "mean"),
+            avg_1=("avg_1", "mean"), count_0=("count_0", "sum"), count_1=("count_1", "sum"),
+            max_0=("max_0", "max"), max_1=("max_1", "max"))
+        res["avg_noise"] = res["avg_noise"].round(1)
+        res[["avg_0", "avg_1"]] = res[["avg_0", "avg_1"]].round(0)
+        res.insert(0, "threshold", threshold)
+        return res
+
+    def histogram(self, bins=64, column="strength", by=["arg1", "arg2"], value_range=(0, 4096), table="alc"):
+        """
+        Histogram of a column of every group of runs, all groups in one bincount
+
+        Args:
+            bins (int or array): number of equal bins in value_range or the bin edges
+            column (str): column of the table ("strength", "value", ...)
+            by (list): columns to group by
+            value_range (tuple): (lowest, highest) value when bins is a number, values outside are not counted
+            table (str): "alc" or "adc"
+
+        Returns:
+            pd.DataFrame: index by, one column per bin (labeled with its left edge)
+        """
+        data = self.alc if table == "alc" else self.adc
+        edges = np.linspace(value_range[0], value_range[1], bins + 1) if np.ndim(bins) == 0 else np.asarray(bins)
+        values = data[column].to_numpy()
+        # bins are [left, right), the last one also takes its right edge (as np.histogram)
+        index = np.searchsorted(edges, values, side="right") - 1
+        index[values == edges[-1]] = len(edges) - 2
+        valid = (index >= 0) & (index < len(edges) - 1)
+        grouped = data.groupby(by, observed=True)
+        codes = grouped.ngroup().to_numpy()
+        groups = grouped.size().index
+        nr_bins = len(edges) - 1
+        counts = np.bincount(codes[valid] * nr_bins + index[valid], minlength=len(groups) * nr_bins)
+        return pd.DataFrame(counts.reshape(len(groups), nr_bins), index=groups, columns=pd.Index(edges[:-1], name=column))
+
+    # * PRIVATE METHODS
+
+    @staticmethod
+    def _table(columns, names, categorical=[]):
+        """ concatenates the column arrays of all runs into one pd.DataFrame, run is categorical (file names) """
+        if len(names) == 0:
+            return pd.DataFrame(columns=list(columns.keys()))
+        res = pd.DataFrame({k: np.concatenate(v) for k, v in columns.items()})
+        res["run"] = pd.Categorical.from_codes(res["run"].to_numpy(), categories=names)
+        for k in categorical:
+            res[k] = res[k].astype("category")
+        return res
+
+
+def _load_dump(file):
+    """ worker function of RxDataset.from_directory (module level so it can be used in a process pool) """
+    # data_rx_<arg1>_<arg2>: numbers when possible
+    parts = file.name.split("_")
+    args = [_number(x) for x in (parts[2:4] if len(parts) >= 4 else [None, None])]
+    with open(file, "r") as f:
+        res = parse_rx_dump(f.read())
+    res.pop("alc_data")
+    res["arg1"], res["arg2"] = args
+    return res
+
+
+def _number(text):
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return text
@@ -0,0 +1,158 @@
+""" Rendering of adc lines (asp.Rx) without the pyplot state machine: one Agg figure is made once and reused,
+    every plot only updates the line data and the title before it is written. Many plots can be rendered in a pool
+    of worker processes (each with its own figure) or into one multi-panel or multi-page (pdf) file per dump """
+import os
+from contextlib import contextmanager
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib import rcParams
+from matplotlib.figure import Figure
+from matplotlib.image import imsave
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+
+ADC_YLIM = (-50, 4146)
+
+
+class AdcPlotter():
+    """ Reusable Agg figure with one axes and one line, the layout of asp.Rx adc plots """
+
+    def __init__(self, ylim=ADC_YLIM, figsize=None, dpi=None, compress_level=6):
+        """
+        Args:
+            ylim (tuple): y limits of the plots (defaults to the adc range)
+            figsize (tuple): size of the figure in inch (defaults to matplotlib's default)
+            dpi (int): resolution of the written files (defaults to matplotlib's default)
+            compress_level (int): zlib level of the png files (0-9), encoding takes most of the time of a plot,
+                1 writes faster (bigger files)
+        """
+        self.ylim = ylim
+        self.dpi = dpi
+        self.compress_level = compress_level
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.line, = self.ax.plot([], [])
+        self._setup(self.ax, "")
+        # line and title change with every plot, the rest (axes, ticks, labels, grid) is drawn once per x range
+        self.line.set_animated(True)
+        self.ax.title.set_animated(True)
+        self._background = None
+        self._xlim = None
+
+    def render(self, data, name, title=None):
+        """ writes one plot of data to name (extension defines the format, png when there is none), returns name
+            title defaults to the file name of name """
+        self._update(self.ax, self.line, data, title if title else os.path.basename(name))
+        extension = os.path.splitext(name)[1][1:].lower()
+        if extension not in ["", "png"] or rcParams["savefig.format"] != "png":
+            self._background = None
+            with self._full_draw():
+                self.figure.savefig(name)
+            return name
+        if self._background is None or self.ax.get_xlim() != self._xlim:
+            self.canvas.draw()
+            self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+            self._xlim = self.ax.get_xlim()
+        else:
+            self.canvas.restore_region(self._background)
+        self.ax.draw_artist(self.line)
+        self.ax.draw_artist(self.ax.title)
+        imsave(name if extension else f"{name}.png", np.asarray(self.canvas.buffer_rgba()), format="png",
+               dpi=self.figure.dpi, pil_kwargs={"compress_level": self.compress_level})
+        return name
+
+    def render_all(self, jobs):
+        """ renders every (data, name) of jobs on the same figure, returns the list of names """
+        return [self.render(data, name) for data, name in jobs]
+
+    def render_pages(self, jobs, path):
+        """ renders every (data, title) of jobs as one page of the pdf file path, returns path """
+        with self._full_draw(), PdfPages(path) as pdf:
+            for data, title in jobs:
+                self._update(self.ax, self.line, data, title)
+                pdf.savefig(self.figure)
+        return path
+
+    def render_panels(self, jobs, path, columns=2):
+        """ renders every (data, title) of jobs as one panel of a single figure written to path, returns path """
+        rows = max(-(-len(jobs) // columns), 1)
+        width, height = self.figure.get_size_inches()
+        figure = Figure(figsize=(width * min(columns, max(len(jobs), 1)), height * rows), dpi=self.dpi)
+        FigureCanvasAgg(figure)
+        for i, (data, title) in enumerate(jobs):
+            ax = figure.add_subplot(rows, columns, i + 1)
+            line, = ax.plot([], [])
+            self._setup(ax, title)
+            self._update(ax, line, data, title)
+        figure.tight_layout()
+        figure.savefig(path)
+        return path
+
+    # * PRIVATE METHODS
+
+    @contextmanager
+    def _full_draw(self):
+        """ line and title are drawn as regular artists (savefig of vector formats) """
+        self.line.set_animated(False)
+        self.ax.title.set_animated(False)
+        try:
+            yield
+        finally:
+            self.line.set_animated(True)
+            self.ax.title.set_animated(True)
+
+    def _setup(self, ax, title):
+        ax.set_title(title, color="#FF0000")
+        ax.set_ylim(self.ylim)
+        ax.set_xlabel("Sample Number")
+        ax.set_ylabel("ADC value")
+        ax.grid()
+
+    @staticmethod
+    def _update(ax, line, data, title):
+        """ new line data + title, only the x limits follow the data (y limits are fixed) """
+        data = np.asarray(data)
+        line.set_data(np.arange(len(data)), data)
+        ax.set_title(title, color="#FF0000")
+        ax.relim()
+        ax.autoscale_view(scalex=True, scaley=False)
+
+
+def render_parallel(jobs, workers=None, chunk_size=16, **kwargs):
+    """
+    Renders plots in a pool of worker processes, every worker reuses one AdcPlotter for all its plots
+
+    Args:
+        jobs (list): (data, name) of every plot
+        workers (int): number of worker processes (defaults to the number of cores)
+        chunk_size (int): plots per task sent to a worker
+        other kwargs are passed to AdcPlotter (ylim, figsize, dpi, compress_level)
+
+    Returns:
+        list: names of the written plots in order of jobs
+    """
+    jobs = list(jobs)
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    res = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for names in pool.map(_render_chunk, chunks, [kwargs] * len(chunks)):
+            res.extend(names)
+    return res
+
+
+# one plotter per (worker) process and AdcPlotter options
+_PLOTTERS = dict()
+
+
+def plotter(**kwargs):
+    """ returns the AdcPlotter of this process for the options kwargs (made on first use) """
+    key = tuple(sorted(kwargs.items()))
+    if key not in _PLOTTERS.keys():
+        _PLOTTERS[key] = AdcPlotter(**kwargs)
+    return _PLOTTERS[key]
+
+
+def _render_chunk(jobs, kwargs):
+    """ worker function of render_parallel (module level so it can be used in a process pool) """
+    return plotter(**kwargs).render_all(jobs)
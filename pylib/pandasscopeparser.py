@@ -2,12 +2,14 @@
 import matplotlib.pyplot as plt
 import os
 import time
+import numpy as np
 import pandas as pd
 import logging
 from wrappers import calculate_time
 
 # Functions
 from scope_functions import *  # pylint: disable=unused-wildcard-import
+from scopeparser import ScopeParser
 
 # Configure loggin
 # logging.basicConfig(
@@ -336,21 +338,18 @@ class PandasScopeParser():
         return ret
 
     def _analyze_alb_data(self, data, header_dict):
+        # same decoder as ScopeParser (one implementation of the .alb sample layout)
+        codes = ScopeParser._alb_codes(data, header_dict)
+        y_inc = np.array([x["Y_INC"] for x in header_dict])
+        y_org = np.array([x["Y_ORG"] for x in header_dict])
+        if isinstance(codes, np.ndarray):
+            values = codes * y_inc[:, None] + y_org[:, None]
+        else:
+            values = [codes[x] * y_inc[x] + y_org[x] for x in range(len(codes))]
         ret_list = dict()
-        time_list = None
-        for x in range(0, len(header_dict)):
-            temp_list = []
-            if header_dict[x]["WIDTH_BITS"] == 16:
-                for i in range(header_dict[x]["NUM_ROWS"]):
-                    start = (i*2 + x * header_dict[x]["NUM_ROWS"] * 2)
-                    stop = (i*2 + x * header_dict[x]["NUM_ROWS"] * 2) + 2
-                    # temp_list.append((int.from_bytes(data[start:stop], "big", signed=True) * header_dict[x]["Y_INC"] + header_dict[x]["Y_ORG"])*int(header_dict[x]["PROBE_SETUP"]))
-                    temp_list.append((int.from_bytes(
-                        data[start:stop], "big", signed=True) * header_dict[x]["Y_INC"] + header_dict[x]["Y_ORG"]))
-                if not time_list:
-                    time_list = list(
-                        x * header_dict[0]["X_INC"] for x in range(len(temp_list)))
-                ret_list[header_dict[x]["name"]] = temp_list
+        for x in range(len(header_dict)):
+            ret_list[header_dict[x]["name"]] = values[x]
+        time_list = np.arange(len(codes[0]) if len(codes) else 0) * header_dict[0]["X_INC"]
         return [ret_list, time_list]
 
     def _analyze_alb_setup(self, setupfile):
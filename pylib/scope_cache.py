@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+import numpy as np
+from scope_channel import ScopeChannel
+
+DEFAULT_DIR = Path(Path.home(), ".cache", "scopeparser")
+# only directories named after a key (sha1) are cache entries, anything else in the directory is left alone
+ENTRY_NAME = re.compile(r"[0-9a-f]{40}")
+# entry that is being written by process <pid>, left behind when that process was killed
+TEMP_NAME = re.compile(r"[0-9a-f]{40}\.tmp\d+")
+# age (s) after which an unfinished entry is considered abandoned
+TEMP_MAX_AGE = 3600
+
+
+class ScopeCache():
+    """ On-disk cache of parsed captures: raw adc codes per channel (.npy, memory mapped when loaded) + header information (.json).
+        Entries are keyed by absolute path, size and mtime of the files and the parser version,
+        the least recently used entries are removed when the cache grows above max_size """
+
+    def __init__(self, directory=None, max_size=2 * 1024 ** 3):
+        """
+        Args:
+            directory (Path(Windows or Posix)): directory of the cache (defaults to ~/.cache/scopeparser)
+            max_size (int): maximum size of the cache in bytes (defaults to 2 GiB)
+        """
+        self.directory = Path(directory) if directory else DEFAULT_DIR
+        self.max_size = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, files, entry_type, version):
+        """ returns the cache key (str) of a capture made out of files """
+        ident = [entry_type, str(version)]
+        for file in files:
+            stat = Path(file).stat()
+            ident.append([str(Path(file).resolve()), stat.st_size, stat.st_mtime_ns])
+        return hashlib.sha1(json.dumps(ident).encode("utf8")).hexdigest()
+
+    def load(self, key):
+        """ returns [dict(name: ScopeChannel), sample_interval] or None when key is not in the cache """
+        entry = Path(self.directory, key)
+        try:
+            with open(Path(entry, "meta.json"), "r") as f:
+                meta = json.load(f)
+            channels = dict()
+            for x in meta["channels"]:
+                codes = np.load(Path(entry, x["file"]), mmap_mode="r")
+                channels[x["name"]] = ScopeChannel(x["name"], codes, x["header"], x["mult"], x["off"], x["zero"])
+        except (OSError, ValueError, KeyError):
+            return None
+        # mtime of meta.json is the last time the entry was used (LRU)
+        os.utime(Path(entry, "meta.json"))
+        return [channels, meta["xincr"]]
+
+    def store(self, key, channels, xincr, files=()):
+        """ stores the codes, scaling and headers of the channels (dict(name: ScopeChannel)) under key """
+        entry = Path(self.directory, key)
+        if entry.exists():
+            return
+        temp = Path(self.directory, f"{key}.tmp{os.getpid()}")
+        temp.mkdir(parents=True, exist_ok=True)
+        meta = {"files": [str(Path(x).resolve()) for x in files], "xincr": xincr, "channels": []}
+        for i, (name, channel) in enumerate(channels.items()):
+            np.save(Path(temp, f"{i}.npy"), np.asarray(channel.codes))
+            meta["channels"].append({"name": name, "file": f"{i}.npy", "header": channel.header,
+                                     "mult": float(channel.mult), "off": float(channel.off), "zero": float(channel.zero)})
+        with open(Path(temp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        try:
+            os.replace(temp, entry)
+        except OSError:
+            # stored by another process in the meantime
+            shutil.rmtree(temp, ignore_errors=True)
+        self.evict()
+
+    def invalidate(self, path=None):
+        """ removes the entries that contain file path, or every entry when path is None
+            (entries of which the metadata can't be read are kept) """
+        target = str(Path(path).resolve()) if path else None
+        for entry in self._entries():
+            if target:
+                try:
+                    with open(Path(entry, "meta.json"), "r") as f:
+                        if target not in json.load(f)["files"]:
+                            continue
+                except (OSError, ValueError, KeyError):
+                    continue
+            shutil.rmtree(entry, ignore_errors=True)
+        if target is None:
+            self.clean_temp()
+
+    def clean_temp(self, max_age=TEMP_MAX_AGE):
+        """ removes unfinished entries (<key>.tmp<pid>) older than max_age seconds, left behind by killed processes """
+        for temp in self._temp_entries():
+            try:
+                if time.time() - temp.stat().st_mtime > max_age:
+                    shutil.rmtree(temp, ignore_errors=True)
+            except OSError:
+                continue
+
+    def evict(self):
+        """ removes abandoned unfinished entries and the least recently used entries until the cache is smaller than max_size """
+        self.clean_temp()
+        entries = sorted(self._entries(), key=lambda x: self._last_used(x))
+        total = sum(self._entry_size(x) for x in entries + self._temp_entries())
+        while entries and total > self.max_size:
+            entry = entries.pop(0)
+            total -= self._entry_size(entry)
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def size(self):
+        """ returns the size of the cache in bytes (unfinished entries included) """
+        return sum(self._entry_size(x) for x in self._entries() + self._temp_entries())
+
+    # * PRIVATE METHODS
+
+    def _entries(self):
+        return [x for x in self.directory.iterdir()
+                if x.is_dir() and ENTRY_NAME.fullmatch(x.name) and Path(x, "meta.json").is_file()]
+
+    def _temp_entries(self):
+        return [x for x in self.directory.iterdir() if x.is_dir() and TEMP_NAME.fullmatch(x.name)]
+
+    def _last_used(self, entry):
+        try:
+            return Path(entry, "meta.json").stat().st_mtime
+        except OSError:
+            return 0
+
+    def _entry_size(self, entry):
+        try:
+            return sum(x.stat().st_size for x in entry.iterdir() if x.is_file())
+        except OSError:
+            # removed by another process in the meantime
+            return 0
@@ -0,0 +1,66 @@
+import numpy as np
+
+
+class ScopeChannel():
+    """ One scope trace, kept as the raw adc codes that came off the scope together with its scaling.
+        Physical values ((codes - off) * mult + zero) are only calculated on first access of 'values' """
+
+    def __init__(self, name, codes, header=None, mult=1.0, off=0.0, zero=0.0, filt=None, values=None, dtype=np.float64, cache=True):
+        """
+        Args:
+            name (str): name of the trace ("CH1", ...)
+            codes (np.ndarray): raw adc codes, can be a zero-copy view on a (memory mapped) file
+            header (dict): header information of the file the trace originates from
+            mult (float): scale factor (YMULT for .isf, Y_INC for .alb)
+            off (float): offset in adc codes (YOFF for .isf)
+            zero (float): offset in physical units (YZERO for .isf, Y_ORG for .alb)
+            filt (callable): optional function applied on the physical values (e.g. alpha filter)
+            values (np.ndarray): physical values when these are already calculated (e.g. for all channels at once)
+            dtype (np.dtype): dtype of the physical values (np.float32 halves the memory of a decoded trace)
+            cache (bool): keep the physical values after first access, when False only the codes are kept in memory
+                and the physical values are calculated on every access (compact)
+        """
+        self.name = name
+        self.codes = codes
+        self.header = header if header else dict()
+        self.mult = mult
+        self.off = off
+        self.zero = zero
+        self.filt = filt
+        self.dtype = dtype
+        self.cache = cache
+        self._values = values
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __repr__(self):
+        state = "decoded" if self.is_decoded() else "not decoded"
+        return f"ScopeChannel({self.name}, {len(self)} samples, {state})"
+
+    @property
+    def values(self):
+        """ physical values of the trace, decoded (and filtered) on first access """
+        if self._values is not None:
+            return self._values
+        values = self.physical()
+        if self.cache:
+            self._values = values
+        return values
+
+    def physical(self, dtype=None, filtered=True):
+        """ calculates the physical values out of the codes (not cached), dtype defaults to the dtype of the channel
+            filtered: apply filt (when set) """
+        values = np.subtract(self.codes, self.off, dtype=dtype if dtype else self.dtype)
+        values *= self.mult
+        values += self.zero
+        if self.filt and filtered:
+            values = self.filt(values)
+        return values
+
+    def nbytes(self):
+        """ memory used by the trace: codes + cached physical values """
+        return self.codes.nbytes + (self._values.nbytes if isinstance(self._values, np.ndarray) else 0)
+
+    def is_decoded(self):
+        return self._values is not None
@@ -0,0 +1,77 @@
+""" Cycle-synchronous analysis of periodic (mains) traces: cycles are detected on rising level crossings
+    (with hysteresis) and summarized into one row per cycle instead of one value per sample """
+import numpy as np
+import pandas as pd
+
+
+def find_cycles(l_data, level=0.0, hysteresis=None):
+    """ Returns the rising crossings of level as fractional sample indices (np.ndarray), consecutive crossings
+        delimit one cycle. A crossing only counts after the trace was below level - hysteresis / 2 and then above
+        level + hysteresis / 2 (hysteresis defaults to 10% of the peak-to-peak value), noise around level is ignored """
+    data = np.asarray(l_data, dtype=np.float64)
+    if len(data) < 2:
+        return np.empty(0)
+    if hysteresis is None:
+        hysteresis = 0.1 * float(data.max() - data.min())
+    high = level + hysteresis / 2
+    low = level - hysteresis / 2
+    # schmitt trigger: +1 above high, -1 below low, in between the last state is kept (forward fill)
+    arm = np.where(data > high, 1, np.where(data < low, -1, 0)).astype(np.int8)
+    last = np.where(arm != 0, np.arange(len(data)), 0)
+    np.maximum.accumulate(last, out=last)
+    state = arm[last]
+    # first sample of every low -> high transition of the trigger
+    edges = np.flatnonzero((state[1:] == 1) & (state[:-1] == -1)) + 1
+    if len(edges) == 0:
+        return np.empty(0)
+    # the crossing itself: last sample at or below level in front of the edge, interpolated to the next sample
+    below = np.flatnonzero((data[:-1] <= level) & (data[1:] > level))
+    k = below[np.searchsorted(below, edges, side="right") - 1]
+    return k + (level - data[k]) / (data[k + 1] - data[k])
+
+
+def cycle_stats(l_time, l_data, crossings=None, level=0.0, hysteresis=None):
+    """
+    Statistics of every full cycle of a trace
+
+    Args:
+        l_time: sample interval of the trace (e.g. ScopeParser.xincr) or its time data
+        l_data: trace data
+        crossings (np.ndarray): cycle boundaries as fractional sample indices (defaults to find_cycles(l_data, level, hysteresis)),
+            pass the crossings of a reference trace to get the statistics of other traces on the same cycles
+
+    Returns:
+        pd.DataFrame: index cycle, columns start (time), period, frequency, rms, mean, peak, min, voltsec (integral of |data| over the cycle)
+    """
+    data = np.asarray(l_data, dtype=np.float64)
+    if crossings is None:
+        crossings = find_cycles(data, level, hysteresis)
+    # samples of cycle i: from the first sample after crossing i up to (and including) the last one before crossing i + 1
+    bounds = np.floor(crossings).astype(np.int64) + 1
+    if np.ndim(l_time) == 0:
+        dt = float(l_time)
+        start = crossings * dt
+    else:
+        time = np.asarray(l_time, dtype=np.float64)
+        dt = float(time[1] - time[0])
+        start = np.interp(crossings, np.arange(len(time)), time)
+    if len(bounds) < 2:
+        return pd.DataFrame(columns=["start", "period", "frequency", "rms", "mean", "peak", "min", "voltsec"],
+                            index=pd.RangeIndex(0, name="cycle"))
+    count = np.diff(bounds)
+    starts = bounds[:-1]
+    # reduceat sums from every start up to the next start, the last start only delimits
+    total = np.add.reduceat(data, starts)
+    squares = np.add.reduceat(np.square(data), starts)
+    absolute = np.add.reduceat(np.abs(data), starts)
+    peak = np.maximum.reduceat(data, starts)
+    low = np.minimum.reduceat(data, starts)
+    if bounds[-1] < len(data):
+        # reduceat of the last cycle runs up to the end of the trace: recalculate it up to the last crossing
+        last = data[starts[-1]:bounds[-1]]
+        total[-1], squares[-1], absolute[-1] = last.sum(), np.dot(last, last), np.abs(last).sum()
+        peak[-1], low[-1] = last.max(), last.min()
+    period = np.diff(start)
+    return pd.DataFrame({"start": start[:-1], "period": period, "frequency": 1 / period,
+                         "rms": np.sqrt(squares / count), "mean": total / count, "peak": peak, "min": low,
+                         "voltsec": absolute * dt}, index=pd.RangeIndex(len(count), name="cycle"))
@@ -0,0 +1,82 @@
+""" Decimation of (long) traces into plot-ready traces, every function takes
+    l_time: sample interval of the trace (e.g. ScopeParser.xincr) or its time data
+    l_data: trace data
+    and returns [time_data, trace_data] (np.ndarray) """
+import numpy as np
+
+
+def block_mean(l_time, l_data, factor):
+    """ Averages every 'factor' samples, the last block is the average of the remaining samples """
+    data = np.asarray(l_data, dtype=np.float64)
+    full = len(data) // factor * factor
+    res = data[:full].reshape(-1, factor).mean(axis=1)
+    if full < len(data):
+        res = np.append(res, data[full:].mean())
+    if np.ndim(l_time) == 0:
+        # mean time of a block of equally spaced samples is the time of its center
+        starts = np.arange(0, len(data), factor)
+        counts = np.minimum(factor, len(data) - starts)
+        return [(starts + (counts - 1) / 2) * float(l_time), res]
+    return [block_mean(0.0, l_time, factor)[1], res]
+
+
+def minmax_envelope(l_time, l_data, n_out):
+    """ Keeps the minimum and maximum sample (in order of time) of n_out / 2 buckets, spikes stay visible
+        (n_out is rounded down to an even number) """
+    data = np.asarray(l_data)
+    buckets = max(n_out // 2, 1)
+    if len(data) <= n_out:
+        return [_time_at(l_time, np.arange(len(data))), data.copy()]
+    size = len(data) // buckets
+    # buckets - 1 buckets at once (view), the last bucket also takes the remaining samples
+    full = (buckets - 1) * size
+    blocks = data[:full].reshape(-1, size)
+    low = np.append(blocks.argmin(axis=1), data[full:].argmin())
+    high = np.append(blocks.argmax(axis=1), data[full:].argmax())
+    starts = np.arange(len(low)) * size
+    index = np.stack((starts + np.minimum(low, high), starts + np.maximum(low, high)), axis=1).ravel()
+    return [_time_at(l_time, index), data[index]]
+
+
+def lttb(l_time, l_data, n_out):
+    """ Largest-Triangle-Three-Buckets: keeps the n_out samples that preserve the visual shape of the trace """
+    data = np.asarray(l_data, dtype=np.float64)
+    n = len(data)
+    if n_out >= n or n_out < 3:
+        return [_time_at(l_time, np.arange(n)), data.copy()]
+    # equally spaced time: the sample index gives the same triangles (scaled by the sample interval)
+    x = np.arange(n, dtype=np.float64) if np.ndim(l_time) == 0 else np.asarray(l_time, dtype=np.float64)
+    # first and last sample are kept, the samples in between are split in n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    index = np.empty(n_out, dtype=np.int64)
+    index[0] = 0
+    index[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # third point of the triangle: average of the next bucket (the last sample for the last bucket)
+        next_lo, next_hi = (hi, edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = data[next_lo:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (data[lo:hi] - data[a]) - (x[a] - x[lo:hi]) * (avg_y - data[a]))
+        a = lo + int(area.argmax())
+        index[i + 1] = a
+    return [_time_at(l_time, index), data[index]]
+
+
+DECIMATORS = {"mean": block_mean, "minmax": minmax_envelope, "lttb": lttb}
+
+
+def decimate(l_time, l_data, n_out, method="minmax"):
+    """ Decimates a trace to (about) n_out samples with method "mean", "minmax" or "lttb" """
+    if method not in DECIMATORS.keys():
+        raise AttributeError(f"Unknown decimation method {method}, use one of {list(DECIMATORS.keys())}")
+    if method == "mean":
+        return block_mean(l_time, l_data, max(-(-len(l_data) // max(n_out, 1)), 1))
+    return DECIMATORS[method](l_time, l_data, n_out)
+
+
+def _time_at(l_time, index):
+    if np.ndim(l_time) == 0:
+        return index * float(l_time)
+    return np.asarray(l_time)[index]
@@ -0,0 +1,165 @@
+import mmap
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from scopeparser import ScopeParser
+
+
+class ScopeFrames():
+    """ Multi-record (FastFrame) capture: the records are kept as one (frames, points_per_frame) view on the raw adc codes
+        together with the scaling, per-frame statistics are calculated for all frames at once """
+
+    def __init__(self, name, codes, header=None, mult=1.0, off=0.0, zero=0.0, xincr=1.0, xzero=0.0, timestamps=None, dtype=np.float64):
+        """
+        Args:
+            name (str): name of the trace ("CH1", ...)
+            codes (np.ndarray): raw adc codes with shape (frames, points_per_frame), can be a zero-copy view on a file
+            header (dict): header information of the file the frames originate from
+            mult (float): scale factor (YMULT)
+            off (float): offset in adc codes (YOFF)
+            zero (float): offset in physical units (YZERO)
+            xincr (float): sample interval within a frame
+            xzero (float): time of the first sample of a frame relative to its trigger
+            timestamps (np.ndarray): trigger time of every frame (e.g. out of HORizontal:FASTframe:TIMEStamp:ALL?),
+                defaults to back-to-back frames: frame * points_per_frame * xincr
+            dtype (np.dtype): dtype of the physical values
+        """
+        self.name = name
+        self.codes = codes
+        self.header = header if header else dict()
+        self.mult = mult
+        self.off = off
+        self.zero = zero
+        self.xincr = xincr
+        self.xzero = xzero
+        self.dtype = dtype
+        if timestamps is None:
+            timestamps = np.arange(codes.shape[0]) * (codes.shape[1] * xincr)
+        elif len(timestamps) != codes.shape[0]:
+            raise AttributeError(f"{len(timestamps)} timestamps given for {codes.shape[0]} frames")
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+
+    @classmethod
+    def from_isf(cls, path, frames=None, points_per_frame=None, timestamps=None, lazy=True, dtype=np.float64):
+        """
+        Reader for a FastFrame .isf file: all records are in one curve block, back to back
+
+        Args:
+            path (Path(Windows or Posix)): relative or absolute path of the file
+            frames (int): number of frames (defaults to NR_FR of the header)
+            points_per_frame (int): number of samples per frame (defaults to NR_PT of the header)
+            timestamps (np.ndarray): trigger time of every frame (defaults to back-to-back frames)
+            lazy (bool): memory map the file, the codes are a zero-copy view on it (defaults to True)
+            dtype (np.dtype): dtype of the physical values
+
+        Returns:
+            ScopeFrames-object
+        """
+        with open(path, "rb") as f:
+            if lazy:
+                raw = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                raw = f.read()
+        header_list, offset, length = ScopeParser._locate_isf_block(raw)
+        header_dict = ScopeParser._get_header_dict(header_list)
+        codes = ScopeParser._isf_codes(raw, header_dict, offset, length)
+        frames, points_per_frame = cls._frame_layout(len(codes), header_dict, frames, points_per_frame)
+        yzero = header_dict["YZERO"] if header_dict["YZERO"] else 0.0
+        xzero = header_dict["XZERO"] if header_dict["XZERO"] else 0.0
+        # reshape of a contiguous view is a view: no copy of the curve data
+        codes = codes[:frames * points_per_frame].reshape(frames, points_per_frame)
+        return cls(Path(path).stem[-3:], codes, header_dict, header_dict["YMULT"], header_dict["YOFF"], yzero,
+                   header_dict["XINCR"], xzero, timestamps, dtype)
+
+    @classmethod
+    def from_channel(cls, channel, points_per_frame, xincr, xzero=0.0, timestamps=None):
+        """ ScopeFrames-object out of a ScopeChannel (e.g. ScopeParser-object.channels["CH1"]) that holds frames back to back """
+        frames = len(channel) // points_per_frame
+        codes = np.asarray(channel.codes)[:frames * points_per_frame].reshape(frames, points_per_frame)
+        return cls(channel.name, codes, channel.header, channel.mult, channel.off, channel.zero, xincr, xzero,
+                   timestamps, channel.dtype)
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    def __repr__(self):
+        return f"ScopeFrames({self.name}, {self.codes.shape[0]} frames x {self.codes.shape[1]} samples)"
+
+    def __getitem__(self, key):
+        """ physical values of frame(s) key (int, slice or index array) """
+        return self.physical(self.codes[key])
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def points_per_frame(self):
+        return self.codes.shape[1]
+
+    @property
+    def time(self):
+        """ time of the samples within a frame (relative to its trigger) """
+        return np.arange(self.codes.shape[1]) * self.xincr + self.xzero
+
+    @property
+    def values(self):
+        """ physical values of all frames: np.ndarray(frames, points_per_frame) (not cached) """
+        return self.physical(self.codes)
+
+    def physical(self, codes):
+        values = np.subtract(codes, self.off, dtype=self.dtype)
+        values *= self.mult
+        values += self.zero
+        return values
+
+    def stats(self, block_frames=1024):
+        """
+        Per-frame statistics of all frames, calculated on the codes in blocks of block_frames frames
+
+        Returns:
+            pd.DataFrame: index frame, columns timestamp, avg, rms, min, max
+        """
+        frames = self.codes.shape[0]
+        sums = np.empty(frames)
+        squares = np.empty(frames)
+        low = np.empty(frames)
+        high = np.empty(frames)
+        for start in range(0, frames, block_frames):
+            block = np.asarray(self.codes[start:start + block_frames], dtype=np.float64)
+            stop = start + len(block)
+            sums[start:stop] = block.sum(axis=1)
+            squares[start:stop] = np.einsum("ij,ij->i", block, block)
+            low[start:stop] = block.min(axis=1)
+            high[start:stop] = block.max(axis=1)
+        n = self.codes.shape[1]
+        # physical = a * code + b: mean and mean square follow from the sums of codes and squared codes
+        a = self.mult
+        b = self.zero - self.off * self.mult
+        mean_codes = sums / n
+        mean_square = a * a * squares / n + 2 * a * b * mean_codes + b * b
+        low, high = a * low + b, a * high + b
+        if a < 0:
+            low, high = high, low
+        return pd.DataFrame({"timestamp": self.timestamps, "avg": a * mean_codes + b,
+                             "rms": np.sqrt(np.maximum(mean_square, 0)), "min": low, "max": high},
+                            index=pd.RangeIndex(frames, name="frame"))
+
+    # * PRIVATE METHODS
+
+    @staticmethod
+    def _frame_layout(nr_samples, header_dict, frames=None, points_per_frame=None):
+        """ return [frames, points_per_frame] out of the arguments or the header (NR_FR, NR_PT) """
+        if frames is None and points_per_frame is None:
+            frames = header_dict["NR_FR"] if header_dict["NR_FR"] else 1
+            points_per_frame = header_dict["NR_PT"]
+            # some scopes report the total number of points in NR_PT
+            if not points_per_frame or points_per_frame * frames > nr_samples:
+                points_per_frame = nr_samples // frames
+        elif points_per_frame is None:
+            points_per_frame = nr_samples // frames
+        elif frames is None:
+            frames = nr_samples // points_per_frame
+        if frames * points_per_frame > nr_samples or points_per_frame == 0:
+            raise AttributeError(f"{frames} frames of {points_per_frame} samples don't fit in {nr_samples} samples")
+        return [frames, points_per_frame]
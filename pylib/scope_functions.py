@@ -1,56 +1,63 @@
 import math
+import numpy as np
+from scope_decimate import block_mean
+
+def sample_interval(l_time):
+    """ Returns the sample interval, l_time is either the sample interval itself (e.g. ScopeParser.xincr) or time data """
+    if np.ndim(l_time) == 0:
+        return float(l_time)
+    t = np.asarray(l_time[:2])
+    return float(t[1] - t[0])
 
 def min_max(l_data):
     return (min(l_data), max(l_data))
 
-def voltsec_product_old(l_time, l_data, freq):
-    """ Generates a running voltsecond product where the refresh time is depending on frequency of the mains """
-    # TODO: optimize function to be not so computational heavy (look at RMS function for inspiration)
-    l_time = list(l_time) # list objects calculates faster than Series object
-    l_data = list(l_data) # list objects calculates faster than Series object
-    time_step = 1 / freq / 2 
-    nr_samples = int(time_step / (l_time[1] - l_time[0]))
-    absolute = [abs(l_data[x]) for x in range(len(l_data))]
-    accum = []
-    for i in range(len(absolute)):
-        if i >= (len(absolute) - 1):
-            i = len(absolute)-2
-        res_accum = (absolute[i+1]+absolute[i])/2*(l_time[i+1]-l_time[i])
-        accum.append(res_accum)
-    ret = []
-    for i in range(len(accum)):
-        nr = nr_samples if i >= nr_samples else i
-        x = sum(accum[(i-nr) : (i+1)])
-        ret.append(round(x, 2))
-    return ret
+def voltsec_product_old(l_time, l_data, freq, decimals = 2):
+    """ Generates a running voltsecond product where the refresh time is depending on frequency of the mains
+        returns np.ndarray, rounded to decimals (None: no rounding) """
+    dt = sample_interval(l_time)
+    absolute = np.abs(np.asarray(l_data, dtype=np.float64))
+    time_step = 1 / freq / 2
+    nr_samples = int(time_step / dt)
+    # trapezoid of every sample with the next one, the last sample repeats the last trapezoid
+    accum = np.empty(len(absolute))
+    accum[:-1] = (absolute[1:] + absolute[:-1]) / 2 * dt
+    accum[-1] = accum[-2] if len(accum) > 1 else 0.0
+    return _round(window_sum(accum, nr_samples + 1), decimals)
 
 def vs_help(nr_samples):
     x = 0
     while x < nr_samples:
         pass
 
-def voltsec_product(l_time, l_data, freq, half_per = True):
-    l_time = list(l_time) # list objects calculates faster than Series object
-    l_data = list(l_data) # list objects calculates faster than Series object
+def voltsec_product(l_time, l_data, freq, half_per = True, decimals = 2):
+    """ Generates a running voltsecond product over a (half) period of freq: sum of the trapezoids of the last
+        period, O(n) through prefix sums
+        returns np.ndarray, rounded to decimals (None: no rounding) """
+    dt = sample_interval(l_time)
+    absolute = np.abs(np.asarray(l_data, dtype=np.float64))
     freq = freq * 2 if half_per else freq
     time_step = 1 / freq
-    nr_samples = int(time_step / (l_time[1] - l_time[0]))
-    vs = [(abs(l_data[x]) + abs(l_data[x - 1 if x != 0 else 0]))/2 * (l_time[1] - l_time[0]) for x in range(len(l_data))]
-    vs[0] = (abs(l_data[1]) + abs(l_data[0]))/2 * (l_time[1] - l_time[0])
-    ret = []
-    for i in range(len(vs)):
-        nr = nr_samples if i >= nr_samples else i
-        x = sum(vs[(i-nr) : (i+1)])
-        ret.append(round(x, 2))
-    return ret
+    nr_samples = int(time_step / dt)
+    # trapezoid of every sample with the previous one, the first sample takes the trapezoid with the next one
+    vs = np.empty(len(absolute))
+    vs[1:] = (absolute[1:] + absolute[:-1]) / 2 * dt
+    vs[0] = vs[1] if len(vs) > 1 else 0.0
+    return _round(window_sum(vs, nr_samples + 1), decimals)
 
 def voltsec_product_total(l_time, l_data):
-    """ Returns the volt second product of the entire trace (in float) """
-    l_time = list(l_time) # list objects calculates faster than Series object
-    l_data = list(l_data) # list objects calculates faster than Series object
-    absolute = [abs(l_data[x]) for x in range(len(l_data))]
-    ret = sum(absolute)/(l_time[-1] - l_time[0])
-    return ret
+    """ Returns the volt second product of the entire trace (in float): trapezoid integral of |data| over time """
+    dt = sample_interval(l_time)
+    absolute = np.abs(np.asarray(l_data, dtype=np.float64))
+    if len(absolute) < 2:
+        return 0.0
+    return float((absolute.sum() - (absolute[0] + absolute[-1]) / 2) * dt)
+
+def _round(data, decimals):
+    """ rounds data in place, decimals None leaves data as is """
+    if decimals is None:
+        return data
+    return np.round(data, decimals, out=data)
 
 # old rms_calc_function: computational heavy so passes now when used, code still present
 def rms_calc_old(l_time, l_data, freq):
@@ -69,27 +76,61 @@ def rms_calc_old(l_time, l_data, freq):
     # return accum
     pass
 
-def rms_calc(l_time, l_data, freq, half_per = False):
+def window_sum(l_data, nr_samples, stable=True, block_size=1 << 16):
+    """ Returns the running sum over the last nr_samples samples (np.ndarray), the first nr_samples sums are cumulative.
+        Sums are differences of cumulative sums, stable: the cumulative sum restarts every block_size samples so the
+        rounding error stays bounded by the size of a block instead of growing with the length of the trace
+        l_data: one trace or a (channels, samples) array, the sums run along the last axis """
+    data = np.asarray(l_data, dtype=np.float64)
+    n = data.shape[-1]
+    if not stable:
+        c = np.cumsum(data, axis=-1)
+        res = c.copy()
+        res[..., nr_samples:] -= c[..., :max(n - nr_samples, 0)]
+        return res
+    block_size = max(block_size, nr_samples)
+    res = np.empty(data.shape)
+    for start in range(0, n, block_size):
+        # re-anchor: cumulative sum from the first sample of the first window that ends in this block
+        anchor = max(0, start - nr_samples)
+        c = np.cumsum(data[..., anchor:start + block_size], axis=-1)
+        # c shifted by nr_samples (zeros in front) holds the cumulative sum in front of every window
+        length = c.shape[-1]
+        lag = min(nr_samples, length)
+        shifted = np.concatenate((np.zeros(c.shape[:-1] + (lag,)), c[..., :length - lag]), axis=-1)
+        res[..., start:anchor + length] = c[..., start - anchor:] - shifted[..., start - anchor:]
+    return res
+
+def rms_calc(l_time, l_data, freq, half_per = False, stable = True):
     """ applies RMS calculation on a data trace, this is done on a period basis.
-        For a half period basis, please multiply freq by 2 """
-    l_time = list(l_time) # list objects calculates faster than Series object
-    l_data = list(l_data) # list objects calculates faster than Series object
+        For a half period basis, please multiply freq by 2
+        l_time: sample interval of the trace (or its time data)
+        l_data: one trace or a (channels, samples) array
+        returns np.ndarray, the first period is the rms of the samples so far """
+    data = np.asarray(l_data, dtype=np.float64)
     freq = freq * 2 if half_per else freq
     time_step = 1 / freq
-    nr_samples = int(time_step / (l_time[1] - l_time[0]))
-    incr = 0
-    accum = []
-    test = 0
-    squared = [pow(l_data[x], 2) for x in range(len(l_data))]
-    for i in range(len(l_data)):
-        if incr < nr_samples:
-            test = test + squared[i]
-            accum.append(math.sqrt(test/(i+1)))
-            incr += 1
-        else:
-            test = test - squared[i-nr_samples] + squared[i]
-            accum.append(math.sqrt(test/nr_samples))
-    return accum
+    nr_samples = int(time_step / sample_interval(l_time))
+    mean_square = window_sum(np.square(data), nr_samples, stable)
+    count = np.minimum(np.arange(1, data.shape[-1] + 1), nr_samples)
+    mean_square /= count
+    # rounding can make the sum of a window of zeros slightly negative
+    return np.sqrt(np.maximum(mean_square, 0, out=mean_square), out=mean_square)
+
+def rms_avg_stream(blocks):
+    """ Reduces an iterable of data blocks (e.g. the traces of ScopeParser.iter_isf) to (rms, average) of the whole trace,
+        only running sums are kept so the trace never needs to be in memory completely """
+    count = 0
+    total = 0.0
+    total_squared = 0.0
+    for block in blocks:
+        block = np.asarray(block, dtype=float)
+        count += block.size
+        total += float(block.sum())
+        total_squared += float(np.dot(block, block))
+    if count == 0:
+        raise Exception("no data in the blocks")
+    return (math.sqrt(total_squared / count), total / count)
 
 def avg_list(l):
     """ Returns the overall average of all numbers in list 'l' """
@@ -97,54 +138,73 @@ def avg_list(l):
 # avg_list_lambda = lambda x: sum(x)/len(x)
 
 def alpha_filter(l, alpha):
-    """ applies alpha filter on a data trace """
-    l = list(l) # list objects calculates faster than Series object
-    y = l[0]
-    res = []
-    for x in range(len(l)):
-        y = alpha * y + (1-alpha) * l[x]
-        res.append(y)
-    return res
+    """ applies alpha filter on a data trace (or on every row of a (channels, samples) array), returns np.ndarray """
+    return first_order_filter(l, alpha)[0]
+
+def first_order_filter(data, alpha, zi=None):
+    """ First order IIR filter y[n] = alpha * y[n-1] + (1 - alpha) * x[n] along the last axis of data
+        (1D trace or 2D (channels, samples) array, all channels in one call)
+        zi: previous output per channel (state), defaults to the first sample of every channel
+        returns (y, zf): filtered data + final state, pass zf as zi of the next chunk to continue filtering """
+    x = np.asarray(data)
+    if not np.issubdtype(x.dtype, np.floating):
+        x = x.astype(np.float64)
+    if x.shape[-1] == 0:
+        return (x.copy(), np.asarray(zi) if zi is not None else None)
+    y_prev = np.array(x[..., 0] if zi is None else zi, dtype=x.dtype)
+    try:
+        from scipy.signal import lfilter
+    except ImportError:
+        y = _first_order_numpy(x, alpha, y_prev)
+    else:
+        # lfilter state (transposed direct form) of y[n] = b0 * x[n] - a1 * y[n-1] is -a1 * y[n-1]
+        zi_lfilter = (alpha * y_prev)[..., np.newaxis]
+        y = lfilter([1 - alpha], [1, -alpha], x, axis=-1, zi=zi_lfilter)[0]
+    return (y, y[..., -1].copy())
 
-def avg_calc(l_time, l_data, freq):
-    """ applies RMS calculation on a data trace, computational heavy (look to optimize?) """
-    l_time = list(l_time) # list objects calculates faster than Series object
-    l_data = list(l_data) # list objects calculates faster than Series object
+def _first_order_numpy(x, alpha, y_prev):
+    """ closed form of the first order recurrence on chunks of samples:
+        y[k] = alpha^(k+1) * y_prev + (1 - alpha) * alpha^k * cumsum(x[j] / alpha^j)
+        chunks are short enough that alpha^-k stays in range, only the state between chunks is a python loop """
+    if alpha <= 0:
+        return x.copy()
+    n = x.shape[-1]
+    chunk = int(27 / -np.log(alpha)) if alpha < 1 else n
+    chunk = max(1, min(chunk, n))
+    nr_chunks = -(-n // chunk)
+    powers = alpha ** np.arange(chunk + 1, dtype=np.float64)
+    blocks = np.zeros(x.shape[:-1] + (nr_chunks * chunk,), dtype=x.dtype)
+    blocks[..., :n] = x
+    blocks = blocks.reshape(x.shape[:-1] + (nr_chunks, chunk))
+    # response of every chunk with a zero state
+    blocks /= powers[:chunk]
+    np.cumsum(blocks, axis=-1, out=blocks)
+    blocks *= (1 - alpha) * powers[:chunk]
+    # state at the start of every chunk
+    states = np.empty(x.shape[:-1] + (nr_chunks,), dtype=x.dtype)
+    decay = powers[chunk]
+    for i in range(nr_chunks):
+        states[..., i] = y_prev
+        y_prev = decay * y_prev + blocks[..., i, -1]
+    blocks += powers[1:] * states[..., np.newaxis]
+    return blocks.reshape(x.shape[:-1] + (nr_chunks * chunk,))[..., :n]
+
+def avg_calc(l_time, l_data, freq, stable = True):
+    """ applies running average calculation on a data trace, this is done on a period basis
+        l_time: sample interval of the trace (or its time data)
+        l_data: one trace or a (channels, samples) array
+        returns np.ndarray, the first period is the sum of the samples so far divided by the samples of a full period """
     time_step = 1 / freq
-    nr_samples = int(time_step / (l_time[1] - l_time[0]))
-    incr = 0
-    accum = []
-    test = 0
-    for i in range(len(l_data)):
-        if incr < nr_samples:
-            test = test + l_data[i]
-            accum.append(test/nr_samples)
-            incr += 1
-        else:
-            test = test - l_data[i-nr_samples] + l_data[i]
-            accum.append(test/nr_samples)
-    return accum
+    nr_samples = int(time_step / sample_interval(l_time))
+    res = window_sum(l_data, nr_samples, stable)
+    res /= nr_samples
+    return res
 
 def avg_filter_data(l_time, l_data, avg_rate):
     """ Takes time data and measurement data and averages every 'avg_rate' units 
         Watch out, this reduces the number of data points by a factor of 'avg_rate'!
-        Therfore a new time data is return as well:
-            returns : [time_data, trace_data] """
-    l_time = list(l_time) # list objects calculates faster than Series object
-    l_data = list(l_data) # list objects calculates faster than Series object
-    if not len(l_time) == len(l_data):
+        Therfore a new time data is return as well, the last block averages only the remaining samples:
+            returns : [time_data, trace_data] (np.ndarray) """
+    if np.ndim(l_time) != 0 and not len(l_time) == len(l_data):
         raise Exception("time and data list do not match in length")
-    res_time = []
-    res_data = []
-    for i in range(0, len(l_data), avg_rate):
-        time = 0
-        data = 0
-        for x in range(0, avg_rate, 1):
-            a = i + x
-            if a >= len(l_data):
-                a = len(l_data) - 1
-            time = time + l_time[a]
-            data = data + l_data[a]
-        res_time.append(time/avg_rate)
-        res_data.append(data/avg_rate)
-    return [res_time,res_data]
\ No newline at end of file
+    return block_mean(l_time, l_data, avg_rate)
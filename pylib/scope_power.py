@@ -0,0 +1,131 @@
+""" Power-quality analysis of a voltage/current trace pair: instantaneous power, per-cycle P, S, Q, PF, crest factors
+    and cycle-synchronous FFT harmonics/THD, vectorized over the whole capture """
+import numpy as np
+import pandas as pd
+from scope_cycles import find_cycles, cycle_stats
+
+
+def cycle_harmonics(l_data, crossings, order=40, points=None):
+    """
+    Harmonic amplitudes of every cycle: each cycle is resampled to 'points' samples (linear interpolation between
+    its fractional boundaries), so harmonic h is exactly FFT bin h, also when the mains frequency drifts
+
+    Args:
+        l_data: trace data
+        crossings (np.ndarray): cycle boundaries as fractional sample indices (scope_cycles.find_cycles)
+        order (int): highest harmonic
+        points (int): samples per resampled cycle (defaults to the smallest power of 2 above 4 * order)
+
+    Returns:
+        np.ndarray(cycles, order + 1): amplitude (peak) of harmonic 0 (dc) up to order
+    """
+    data = np.asarray(l_data, dtype=np.float64)
+    points = points if points else int(2 ** np.ceil(np.log2(4 * order + 1)))
+    if len(crossings) < 2:
+        return np.empty((0, order + 1))
+    period = np.diff(crossings)
+    position = crossings[:-1, np.newaxis] + period[:, np.newaxis] * (np.arange(points) / points)
+    index = np.minimum(position.astype(np.int64), len(data) - 2)
+    fraction = position - index
+    resampled = data[index] * (1 - fraction) + data[index + 1] * fraction
+    spectrum = np.abs(np.fft.rfft(resampled, axis=1)[:, :order + 1]) / points
+    spectrum[:, 1:] *= 2
+    return spectrum
+
+
+def thd(harmonics):
+    """ Total harmonic distortion (ratio) of every row of harmonic amplitudes (cycle_harmonics) """
+    harmonics = np.asarray(harmonics)
+    return np.sqrt(np.square(harmonics[..., 2:]).sum(axis=-1)) / harmonics[..., 1]
+
+
+class PowerAnalysis():
+    """ Power analysis of one voltage/current pair, cycles are detected on the voltage """
+
+    def __init__(self, l_time, voltage, current, order=40, level=0.0, hysteresis=None, xzero=0.0):
+        """
+        Args:
+            l_time: sample interval of the traces (e.g. ScopeParser.xincr) or their time data
+            voltage: voltage trace data
+            current: current trace data
+            order (int): highest harmonic of the FFT analysis
+            level (float): crossing level of the voltage for cycle detection
+            hysteresis (float): hysteresis around level (defaults to 10% of the peak-to-peak voltage)
+            xzero (float): time of the first sample (added to the start of the cycles)
+        """
+        self.l_time = l_time
+        self.voltage = np.asarray(voltage, dtype=np.float64)
+        self.current = np.asarray(current, dtype=np.float64)
+        if len(self.voltage) != len(self.current):
+            raise AttributeError("voltage and current trace do not match in length")
+        self.order = order
+        self.xzero = xzero
+        self.crossings = find_cycles(self.voltage, level, hysteresis)
+        self._cycles = None
+
+    @property
+    def instantaneous(self):
+        """ instantaneous power p(t) = v(t) * i(t) """
+        return self.voltage * self.current
+
+    @property
+    def cycles(self):
+        """
+        pd.DataFrame, one row per cycle: start, period, frequency, V_rms, I_rms, P (real), S (apparent),
+        Q (non-active, sqrt(S^2 - P^2)), PF, V_crest, I_crest, V_thd, I_thd
+        """
+        if self._cycles is None:
+            self._cycles = self._cycle_table()
+        return self._cycles
+
+    def harmonics(self, trace="current"):
+        """ pd.DataFrame of the harmonic amplitudes (columns 0 (dc) up to order) of every cycle of "voltage" or "current" """
+        data = self.voltage if trace == "voltage" else self.current
+        return pd.DataFrame(cycle_harmonics(data, self.crossings, self.order),
+                            index=pd.RangeIndex(max(len(self.crossings) - 1, 0), name="cycle"))
+
+    def summary(self):
+        """ dict with the totals over all full cycles (weighted by their period) """
+        cycles = self.cycles
+        weight = cycles["period"].to_numpy()
+        if len(weight) == 0:
+            return dict(cycles=0)
+        v_rms = np.sqrt(np.average(np.square(cycles["V_rms"]), weights=weight))
+        i_rms = np.sqrt(np.average(np.square(cycles["I_rms"]), weights=weight))
+        p = np.average(cycles["P"], weights=weight)
+        s = v_rms * i_rms
+        return dict(cycles=len(cycles), frequency=len(cycles) / weight.sum(), V_rms=v_rms, I_rms=i_rms, P=p, S=s,
+                    Q=np.sqrt(max(s * s - p * p, 0.0)), PF=p / s if s else np.nan,
+                    V_crest=cycles["V_crest"].max(), I_crest=cycles["I_crest"].max(),
+                    V_thd=cycles["V_thd"].mean(), I_thd=cycles["I_thd"].mean())
+
+    # * PRIVATE METHODS
+
+    def _cycle_table(self):
+        v = cycle_stats(self.l_time, self.voltage, self.crossings)
+        i = cycle_stats(self.l_time, self.current, self.crossings)
+        p = cycle_stats(self.l_time, self.instantaneous, self.crossings)
+        res = v[["start", "period", "frequency"]].copy()
+        res["start"] += self.xzero
+        res["V_rms"] = v["rms"]
+        res["I_rms"] = i["rms"]
+        res["P"] = p["mean"]
+        res["S"] = v["rms"] * i["rms"]
+        res["Q"] = np.sqrt(np.maximum(np.square(res["S"]) - np.square(res["P"]), 0))
+        res["PF"] = res["P"] / res["S"]
+        res["V_crest"] = np.maximum(v["peak"], -v["min"]) / v["rms"]
+        res["I_crest"] = np.maximum(i["peak"], -i["min"]) / i["rms"]
+        res["V_thd"] = thd(cycle_harmonics(self.voltage, self.crossings, self.order))
+        res["I_thd"] = thd(cycle_harmonics(self.current, self.crossings, self.order))
+        return res
+
+
+def summarize(captures, voltage, current, *args, **kwargs):
+    """ Power summary of many captures: captures is an iterable of (name, ScopeParser-object)
+        (e.g. ScopeParser.from_directory, failed captures (exceptions) are skipped), returns pd.DataFrame indexed by name """
+    rows = dict()
+    for name, obj in captures:
+        if isinstance(obj, Exception):
+            continue
+        rows[name] = obj.power(voltage, current, *args, **kwargs).summary()
+    return pd.DataFrame.from_dict(rows, orient="index")
@@ -0,0 +1,185 @@
+""" Streaming counterparts of scope_functions: small objects that keep a compact state and take successive blocks
+    of a trace (e.g. ScopeParser.iter_isf or a live acquisition). update(block) returns the output of that block,
+    over all blocks the output is bit-identical to the batch function on the concatenated data """
+import numpy as np
+from scope_functions import sample_interval, first_order_filter
+
+
+class WindowSum():
+    """ Streaming scope_functions.window_sum: running sum over the last nr_samples samples
+        state: the last nr_samples samples and the cumulative sums of the current (re-anchored) block """
+
+    def __init__(self, nr_samples, stable=True, block_size=1 << 16):
+        self.nr_samples = nr_samples
+        # the batch function restarts the cumulative sum every block_size samples (aligned to the first sample)
+        self.block_size = max(block_size, nr_samples) if stable else None
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self._history = np.empty(0)
+        self._cumsum = np.empty(0)
+        self._local = 0
+
+    def update(self, block):
+        data = np.asarray(block, dtype=np.float64)
+        res = np.empty(len(data))
+        done = 0
+        while done < len(data):
+            if self.block_size and self.count % self.block_size == 0 and self.count > 0:
+                self._anchor()
+            n = len(data) - done
+            if self.block_size:
+                n = min(n, self.block_size - self.count % self.block_size)
+            res[done:done + n] = self._sums(data[done:done + n])
+            done += n
+        return res
+
+    def _anchor(self):
+        """ new block: the cumulative sum restarts at the first sample of the first window that ends in the block """
+        self._cumsum = np.cumsum(self._history)
+        self._local = len(self._cumsum)
+
+    def _sums(self, data):
+        # continue the cumulative sum: cumsum of [last sum, data] adds the samples in the same order as the batch
+        if len(self._cumsum):
+            c = np.cumsum(np.concatenate((self._cumsum[-1:], data)))[1:]
+        else:
+            c = np.cumsum(data)
+        # cumulative sum nr_samples samples earlier (0.0 in front of the anchor)
+        kept = len(self._cumsum)
+        combined = np.concatenate((self._cumsum, c))
+        earlier = np.arange(self._local, self._local + len(data)) - self.nr_samples
+        shifted = np.zeros(len(data))
+        valid = earlier >= 0
+        shifted[valid] = combined[earlier[valid] - (self._local - kept)]
+        res = c - shifted
+        self._local += len(data)
+        self._cumsum = combined[-min(self.nr_samples, len(combined)):] if self.nr_samples else combined[:0]
+        self._history = np.concatenate((self._history, data))[-self.nr_samples:] if self.nr_samples else data[:0]
+        self.count += len(data)
+        return res
+
+
+class RunningRms():
+    """ Streaming scope_functions.rms_calc """
+
+    def __init__(self, l_time, freq, half_per=False, stable=True):
+        freq = freq * 2 if half_per else freq
+        self.nr_samples = int(1 / freq / sample_interval(l_time))
+        self._sum = WindowSum(self.nr_samples, stable)
+
+    def reset(self):
+        self._sum.reset()
+
+    def update(self, block):
+        start = self._sum.count
+        data = np.asarray(block, dtype=np.float64)
+        mean_square = self._sum.update(np.square(data))
+        count = np.minimum(np.arange(start + 1, start + len(data) + 1), self.nr_samples)
+        mean_square /= count
+        return np.sqrt(np.maximum(mean_square, 0, out=mean_square), out=mean_square)
+
+
+class RunningAvg():
+    """ Streaming scope_functions.avg_calc """
+
+    def __init__(self, l_time, freq, stable=True):
+        self.nr_samples = int(1 / freq / sample_interval(l_time))
+        self._sum = WindowSum(self.nr_samples, stable)
+
+    def reset(self):
+        self._sum.reset()
+
+    def update(self, block):
+        res = self._sum.update(block)
+        res /= self.nr_samples
+        return res
+
+
+class AlphaFilter():
+    """ Streaming scope_functions.alpha_filter, state: the last output
+        (bit-identical with scipy, the NumPy fallback of first_order_filter matches within rounding) """
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        self.state = None
+
+    def update(self, block):
+        data = np.asarray(block)
+        if data.shape[-1] == 0:
+            return first_order_filter(data, self.alpha)[0]
+        y, self.state = first_order_filter(data, self.alpha, self.state)
+        return y
+
+
+class VoltSecIntegrator():
+    """ Streaming scope_functions.voltsec_product, state: the last sample + the running window sum
+        the first trapezoid needs the second sample: the output of the first sample comes with the next block """
+
+    def __init__(self, l_time, freq, half_per=True, decimals=2):
+        self.dt = sample_interval(l_time)
+        freq = freq * 2 if half_per else freq
+        self.nr_samples = int(1 / freq / self.dt)
+        self.decimals = decimals
+        self._sum = WindowSum(self.nr_samples + 1)
+        self.reset()
+
+    def reset(self):
+        self._sum.reset()
+        self._last = np.empty(0)
+
+    def update(self, block):
+        absolute = np.abs(np.asarray(block, dtype=np.float64))
+        if len(absolute) == 0:
+            return np.empty(0)
+        if self._sum.count == 0:
+            # start of the trace: the first trapezoid is the one of the first two samples
+            absolute = np.concatenate((self._last, absolute))
+            if len(absolute) < 2:
+                self._last = absolute
+                return np.empty(0)
+            vs = np.empty(len(absolute))
+            vs[1:] = (absolute[1:] + absolute[:-1]) / 2 * self.dt
+            vs[0] = vs[1]
+        else:
+            vs = (absolute + np.concatenate((self._last, absolute[:-1]))) / 2 * self.dt
+        self._last = absolute[-1:]
+        res = self._sum.update(vs)
+        if self.decimals is None:
+            return res
+        return np.round(res, self.decimals, out=res)
+
+
+class BlockMean():
+    """ Streaming scope_decimate.block_mean (avg_filter_data), state: the samples of the unfinished block
+        update() returns [time_data, trace_data] of the finished blocks, flush() the average of the remaining samples """
+
+    def __init__(self, l_time, factor):
+        self.dt = sample_interval(l_time)
+        self.factor = factor
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self._rest = np.empty(0)
+
+    def update(self, block):
+        data = np.concatenate((self._rest, np.asarray(block, dtype=np.float64)))
+        full = len(data) // self.factor * self.factor
+        res = data[:full].reshape(-1, self.factor).mean(axis=1)
+        starts = self.count + np.arange(0, full, self.factor)
+        self._rest = data[full:]
+        self.count += full
+        return [(starts + (self.factor - 1) / 2) * self.dt, res]
+
+    def flush(self):
+        if len(self._rest) == 0:
+            return [np.empty(0), np.empty(0)]
+        res = [np.array([(self.count + (len(self._rest) - 1) / 2) * self.dt]), np.array([self._rest.mean()])]
+        self.count += len(self._rest)
+        self._rest = np.empty(0)
+        return res
@@ -1,10 +1,21 @@
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
+import json
 import logging
+import mmap
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
 from wrappers import calculate_time
-from scope_functions import rms_calc, avg_calc, alpha_filter
+from scope_functions import rms_calc, avg_calc, alpha_filter, first_order_filter
+from scope_decimate import decimate
+from scope_cycles import find_cycles, cycle_stats
+from scope_power import PowerAnalysis
+from scope_channel import ScopeChannel
+from scope_cache import ScopeCache
 from datetime import datetime as dt
 
 # Configure loggin
@@ -12,6 +23,54 @@ FILE_DIR = Path(__file__).parent.resolve()
 logging.basicConfig(
     filename=Path(FILE_DIR, "scopeparser.log"), format="%(asctime)s %(message)s", level=logging.INFO)
 
+# part of the ScopeCache key: increase when parsing changes the codes/headers that are stored
+PARSER_VERSION = 1
+
+# WFMPRE keywords: long form -> (shortest abbreviation, key in header_dict, conversion of the value)
+ISF_KEYWORDS = {
+    "BYT_NR": ("BYT_N", "BYT_NR", int),
+    "BIT_NR": ("BIT_N", "BIT_NR", int),
+    "ENCDG": ("ENC", "ENCODING", lambda x: x.upper()[:3]),
+    "BN_FMT": ("BN_F", "BINARY_FORMAT", lambda x: x.upper()[:2]),
+    "BYT_OR": ("BYT_O", "BYT_OR", lambda x: x.upper()[:3]),
+    "WFID": ("WFI", "WFID", str),
+    "NR_PT": ("NR_P", "NR_PT", int),
+    "NR_FR": ("NR_F", "NR_FR", int),
+    "PT_FMT": ("PT_F", "PT_FMT", str),
+    "XUNIT": ("XUN", "XUNIT", str),
+    "XINCR": ("XIN", "XINCR", float),
+    "XZERO": ("XZE", "XZERO", float),
+    "PT_OFF": ("PT_O", "PT_OFF", int),
+    "YUNIT": ("YUN", "YUNIT", str),
+    "YMULT": ("YMU", "YMULT", float),
+    "YOFF": ("YOF", "YOFF", float),
+    "YZERO": ("YZE", "YZERO", float),
+    "VSCALE": ("VSCALE", "VSCALE", float),
+    "HSCALE": ("HSCALE", "HSCALE", float),
+    "VPOS": ("VPOS", "VPOS", float),
+    "VOFFSET": ("VOFFSET", "VOFFSET", float),
+    "HDELAY": ("HDELAY", "HDELAY", float),
+}
+# every abbreviation between the short and long form -> (key in header_dict, conversion)
+ISF_KEYWORD_TABLE = {long[:i]: (key, conversion) for long, (short, key, conversion) in ISF_KEYWORDS.items()
+                     for i in range(len(short), len(long) + 1)}
+ISF_HEADER_KEYS = [x[1] for x in ISF_KEYWORDS.values()] + [
+    "WFID_channel", "WFID_coupling", "WFID_y_scale_number", "WFID_y_scale_unit", "WFID_x_scale_number",
+    "WFID_x_scale_unit", "WFID_number_of_points"]
+# BN_FMT -> numpy kind: RIBinary (signed), RPBinary (unsigned), FPBinary (float)
+ISF_BINARY_FORMATS = {"RI": "i", "RP": "u", "FP": "f"}
+WFID_SCALE = re.compile(r"([-+]?[0-9.]+(?:[eE][-+]?[0-9]+)?)\s*([^/\s]*)")
+WFID_POINTS = re.compile(r"(\d+)\s*points")
+
+# key of the ScopeParser metadata in parquet/feather files
+SCOPE_METADATA_KEY = b"scopeparser"
+
+# derived traces: suffix -> function(sample_interval, (channels, samples) array, freq)
+DERIVED_FUNCTIONS = {"rms": rms_calc, "avg": avg_calc}
+
+# sample layout of .alb channels by VALUE_BYTES (big-endian, signed)
+ALB_DTYPES = {1: "i1", 2: ">i2", 4: ">i4"}
+
 
 class ScopeParser():
     # Constructors
@@ -23,6 +82,11 @@ class ScopeParser():
         Args:
             path (Path(Windows or Posix)): relative or absolute path of (one of) the file(s)
             channels (list): channels that will be used (defaults to all 4 regular channels)
+            lazy (bool): memory map the files and only parse their headers, a trace is decoded on first access
+            compact (bool): only keep the raw adc codes + scaling, physical values are calculated on every access
+            dtype (np.dtype): dtype of the physical values (defaults to np.float64, np.float32 halves the memory)
+            time_column (bool): add time as a column to obj.df (defaults to False, time is implicit: obj.time)
+            cache (bool or ScopeCache): load the decoded codes from / store them in an on-disk cache (defaults to None)
 
         Returns:
             ScopeParser-object: [description]
@@ -68,11 +132,195 @@ class ScopeParser():
         return cls(entry_type, files=[absolute_path], *args, **kwargs)
 
     @classmethod
-    def from_dict(cls, obj):
-        pass
+    def from_directory(cls, path, workers=None, channels=["CH1", "CH2", "CH3", "CH4"], *args, **kwargs):
+        """
+        Parses every capture in a directory (.isf sets grouped by basename and .alb files) in a pool of worker processes
+
+        Args:
+            path (Path(Windows or Posix)): relative or absolute path of the directory
+            workers (int): number of worker processes (defaults to the number of cores)
+            channels (list): channels that will be used for .isf sets (defaults to all 4 regular channels)
+            other kwargs are passed to every ScopeParser-object (rms, avg, lazy, ...)
+
+        Yields:
+            (name, ScopeParser-object): in order of completion, name is the basename of the capture.
+            When a capture fails, the raised exception is yielded instead of the ScopeParser-object and the batch goes on
+        """
+        captures = cls._group_captures(Path(path), channels)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_load_capture, cls, entry_type, file, channels, args, kwargs): name
+                       for name, (entry_type, file) in captures.items()}
+            try:
+                for future in as_completed(futures):
+                    name = futures[future]
+                    try:
+                        yield name, future.result()
+                    except Exception as e:
+                        logging.warning(f"{name} could not be parsed: {e!r}")
+                        yield name, e
+            finally:
+                # generator closed before the end: don't start the captures that are still waiting
+                for future in futures:
+                    future.cancel()
+
+    @staticmethod
+    def _group_captures(path, channels):
+        """ return dict(basename: (entry_type, file)) with one (sibling) file per capture in directory path """
+        captures = dict()
+        for file in sorted(path.resolve().iterdir()):
+            if file.suffix.lower() == ".isf" and file.stem[-3:] in channels:
+                captures.setdefault(file.stem[:-3], ("isf", file))
+            elif file.suffix.lower() == ".alb":
+                captures[file.stem] = ("alb", file)
+        return captures
+
+    # Streaming readers
+    @classmethod
+    def iter_isf(cls, path, block_size=1000000):
+        """
+        Reads one .isf file in blocks of samples, only one block is in memory at a time
+
+        Args:
+            path (Path(Windows or Posix)): relative or absolute path of the file
+            block_size (int): number of samples per block (the last block can be shorter)
+
+        Yields:
+            [np.ndarray(time_data), np.ndarray(trace_data)]: time is continuous over the blocks
+        """
+        size = Path(path).stat().st_size
+        with open(path, "rb") as f:
+            head = f.read(4096)
+            # header is ascii and small, but make sure the full "#<n><len>" designator is read
+            while f.tell() < size and (head.find(b"#") < 0 or len(head) < head.find(b"#") + 12):
+                head += f.read(4096)
+            header_list, offset, length = cls._locate_isf_block(head, size)
+            header_dict = cls._get_header_dict(header_list)
+            dtype = cls._isf_dtype(header_dict)
+            if dtype is None:
+                raise AttributeError("Only binary .isf files can be read in blocks (ascii curve data)")
+            yzero = header_dict["YZERO"] if header_dict["YZERO"] else 0.0
+            nr_samples = length // dtype.itemsize
+            f.seek(offset)
+            for start in range(0, nr_samples, block_size):
+                n = min(block_size, nr_samples - start)
+                codes = np.frombuffer(f.read(n * dtype.itemsize), dtype=dtype)
+                time_data = (start + np.arange(len(codes))) * header_dict["XINCR"]
+                yield [time_data, (codes.astype(np.float64) - header_dict["YOFF"]) * header_dict["YMULT"] + yzero]
+
+    @classmethod
+    def iter_alb(cls, path, block_size=1000000):
+        """
+        Reads one .alb file in blocks of samples for all its channels, only one block is in memory at a time
+
+        Args:
+            path (Path(Windows or Posix)): relative or absolute path of the file
+            block_size (int): number of samples per block (the last block can be shorter)
+
+        Yields:
+            [np.ndarray(time_data), dict(name: np.ndarray(trace_data))]: time is continuous over the blocks
+        """
+        with open(path, "rb") as f:
+            alb_header = cls._analyze_alb_header(cls._read_alb_header(f))
+            dtypes = cls._alb_dtypes(alb_header)
+            # every channel is one contiguous block in the file
+            offsets = [f.tell()]
+            for dtype, x in zip(dtypes, alb_header):
+                offsets.append(offsets[-1] + x["NUM_ROWS"] * dtype.itemsize)
+            nr_samples = min(x["NUM_ROWS"] for x in alb_header) if alb_header else 0
+            for start in range(0, nr_samples, block_size):
+                n = min(block_size, nr_samples - start)
+                data = dict()
+                for x in range(len(alb_header)):
+                    f.seek(offsets[x] + start * dtypes[x].itemsize)
+                    codes = np.frombuffer(f.read(n * dtypes[x].itemsize), dtype=dtypes[x])
+                    data[alb_header[x]["name"]] = codes * alb_header[x]["Y_INC"] + alb_header[x]["Y_ORG"]
+                time_data = (start + np.arange(n)) * alb_header[0]["X_INC"]
+                yield [time_data, data]
+
+    @classmethod
+    def from_dict(cls, obj, xincr, *args, **kwargs):
+        """
+        Makes a ScopeParser-object out of traces that are already in memory
+
+        Args:
+            obj (dict): {"CH1": np.ndarray(trace_data) or ScopeChannel, ...}
+            xincr (float): sample interval of the traces
+
+        Returns:
+            ScopeParser-object
+        """
+        return cls("dict", data=obj, xincr=xincr, *args, **kwargs)
+
+    @classmethod
+    def from_parquet(cls, path, columns=None, rows=None, *args, **kwargs):
+        """
+        Loads a ScopeParser-object stored with to_parquet(), only the selected columns and row groups are read
+
+        Args:
+            path (Path(Windows or Posix)): relative or absolute path of the file
+            columns (list): traces that will be loaded (defaults to all)
+            rows (tuple): (start, stop) sample range that will be loaded (defaults to all)
+
+        Returns:
+            ScopeParser-object
+        """
+        import pyarrow.parquet as pq
+        pf = pq.ParquetFile(path)
+        meta = json.loads(pf.schema_arrow.metadata[SCOPE_METADATA_KEY])
+        start, stop = rows if rows else (0, pf.metadata.num_rows)
+        # only read the row groups that overlap with the requested range
+        groups = []
+        first_row = 0
+        group_start = None
+        for i in range(pf.metadata.num_row_groups):
+            nr = pf.metadata.row_group(i).num_rows
+            if first_row < stop and first_row + nr > start:
+                groups.append(i)
+                group_start = first_row if group_start is None else group_start
+            first_row += nr
+        table = pf.read_row_groups(groups, columns=columns)
+        table = table.slice(start - (group_start if group_start else 0), stop - start)
+        return cls._from_arrow(table, meta, start, *args, **kwargs)
+
+    @classmethod
+    def from_feather(cls, path, columns=None, rows=None, *args, **kwargs):
+        """
+        Loads a ScopeParser-object stored with to_feather(), the file is memory mapped so only the selected
+        columns and rows are read (when stored uncompressed)
+
+        Args:
+            path (Path(Windows or Posix)): relative or absolute path of the file
+            columns (list): traces that will be loaded (defaults to all)
+            rows (tuple): (start, stop) sample range that will be loaded (defaults to all)
+
+        Returns:
+            ScopeParser-object
+        """
+        import pyarrow.feather as feather
+        table = feather.read_table(path, columns=columns, memory_map=True)
+        meta = json.loads(table.schema.metadata[SCOPE_METADATA_KEY])
+        start, stop = rows if rows else (0, table.num_rows)
+        return cls._from_arrow(table.slice(start, stop - start), meta, start, *args, **kwargs)
+
+    @classmethod
+    def _from_arrow(cls, table, meta, start, *args, **kwargs):
+        """ return ScopeParser-object out of a pyarrow table + the metadata written by _to_arrow() """
+        channels = dict()
+        for name in table.column_names:
+            data = table.column(name).to_numpy()
+            x = meta["channels"].get(name, dict())
+            if meta["raw"]:
+                channels[name] = ScopeChannel(name, data, x.get("header"), x.get("mult", 1.0), x.get("off", 0.0),
+                                              x.get("zero", 0.0))
+            else:
+                channels[name] = ScopeChannel(name, data, x.get("header"), values=data)
+        return cls("dict", data=channels, xincr=meta["xincr"], xzero=meta["xzero"] + start * meta["xincr"],
+                   *args, **kwargs)
 
     def __init__(self, entry_type, *args, **kwargs):
         self.entry_type = entry_type
+        files = None
+        data = None
         # - determine entry type and act upon them
         if entry_type in ["isf", "alb"]:
             files = kwargs["files"] if "files" in kwargs.keys() else None
@@ -96,220 +344,418 @@ class ScopeParser():
         ) else False
         rms = kwargs["rms"] if "rms" in kwargs.keys() else False
         avg = kwargs["avg"] if "avg" in kwargs.keys() else False
+        lazy = kwargs["lazy"] if "lazy" in kwargs.keys() else False
+        compact = kwargs["compact"] if "compact" in kwargs.keys() else False
+        dtype = kwargs["dtype"] if "dtype" in kwargs.keys() else np.float64
+        self._time_column = kwargs["time_column"] if "time_column" in kwargs.keys() else False
+        cache = kwargs["cache"] if "cache" in kwargs.keys() else None
+        cache = ScopeCache() if cache is True else cache
         # ! rename should be done before calculating rms and avg (making new traces)
 
-        # - create dataframe
-        self.df = pd.DataFrame()
-        if self.entry_type == "isf" and files:
-            first = files[0].name.rstrip(files[0].suffix)[-3:]
-            temp = self._parse_isf(files[0])
-            self.df["time"] = temp[1]
-            if alpha_filter_on:
-                self.df[first] = alpha_filter(temp[0], alpha)
-            else:
-                self.df[first] = temp[0]
-            if len(files[1:]) != 0:
-                for file in files[1:]:
-                    n = file.name.rstrip(file.suffix)[-3:]
-                    if alpha_filter_on:
-                        self.df[n] = alpha_filter(
-                            self._parse_isf(file, False), alpha)
-                    else:
-                        self.df[n] = self._parse_isf(file, False)
+        # - create channels (name -> ScopeChannel), the dataframe is made out of these
+        self.channels = dict()
+        self.xincr = None
+        self.xzero = kwargs["xzero"] if "xzero" in kwargs.keys() else 0.0
+        self._df = None
+        # requested derived traces [(suffix, channels, freq)], computed on first access and memoized per (suffix, channel, freq)
+        self._derived = []
+        self._memo = dict()
+        self._freqs = {"rms": rms_freq, "avg": averaging_freq}
+        cache_key = cache.key(files, entry_type, PARSER_VERSION) if cache and files else None
+        cached = cache.load(cache_key) if cache_key else None
+        if cached:
+            self.channels, self.xincr = cached
+            logging.info(f"{files[0]} loaded from cache")
+
+        elif self.entry_type == "isf" and files:
+            for file in files:
+                n = file.name.rstrip(file.suffix)[-3:]
+                self.channels[n] = self._parse_isf(file, lazy)
+            self.xincr = next(iter(self.channels.values())).header["XINCR"]
 
         elif self.entry_type == "alb" and files:
             basename = Path(files[0].parent, files[0].stem)
-            t = self._parse_alb(basename)
-            self.df["time"] = t[1]
-            for k, v in t[0].items():
-                self.df[k] = v
+            t = self._parse_alb(basename, dtype, not compact)
+            self.xincr = t[1]
+            self.channels.update(t[0])
 
-        # TODO: implement parsing of data array for tektronix connection
         elif self.entry_type == "dict" and data:
-            pass
-
+            for k, v in data.items():
+                if isinstance(v, ScopeChannel) and not v.is_decoded():
+                    self.channels[k] = v
+                else:
+                    # arrays (and decoded channels) are taken as physical values: cast to dtype + alpha filtered
+                    # on first access, just like the codes of isf/alb traces
+                    values = v.values if isinstance(v, ScopeChannel) else v
+                    self.channels[k] = ScopeChannel(k, np.asarray(values), v.header if isinstance(v, ScopeChannel) else None)
+            if "xincr" not in kwargs.keys():
+                raise AttributeError("Please provide the sample interval (xincr) of the traces")
+            self.xincr = kwargs["xincr"]
+
+        if cache_key and not cached:
+            cache.store(cache_key, self.channels, self.xincr, files)
+        # alpha filter of the (isf and in memory) traces, applied when a trace is decoded
+        self._alpha = alpha if alpha_filter_on and self.entry_type in ["isf", "dict"] else None
+        for channel in self.channels.values():
+            if self._alpha is not None:
+                channel.filt = partial(alpha_filter, alpha=alpha)
+            channel.dtype = dtype
+            channel.cache = not compact
         if rename_dict:
-            self.df.rename(columns=rename_dict, inplace=True)
+            self.channels = {rename_dict.get(k, k): v for k, v in self.channels.items()}
+            for k, v in self.channels.items():
+                v.name = k
         if rms:
-            self._apply_func_in_df(rms_calc, specify_rms, rms_freq)
-            # for k, v in self.df.items():
-            #     if specify_rms == None:
-            #         k_new = k + "_rms"
-            #         self.df[k_new] = rms_calc(time_list, v, rms_freq)
-            #     elif str(k) in specify_rms:
-            #         k_new = k + "_rms"
-            #         self.df[k_new] = rms_calc(time_list, v, rms_freq)
+            self._derived.append(("rms", specify_rms, rms_freq))
         if avg:
-            self._apply_func_in_df(avg_calc, specify_avg, averaging_freq)
-            # for k, v in self.df.items():
-            #     if specify_avg == None:
-            #         k_new = k + "_avg"
-            #         self.df[k_new] = avg_calc(
-            #             time_list, v, averaging_freq)
-            #     elif str(k) in specify_avg:
-            #         k_new = k + "_avg"
-            #         self.df[k_new] = avg_calc(
-            #             time_list, v, averaging_freq)
+            self._derived.append(("avg", specify_avg, averaging_freq))
+        # - lazy: only headers are parsed, traces are decoded when first accessed (obj["CH2"] or obj.df)
+        # - compact: only raw codes are kept, physical values are calculated on every access (obj["CH2"])
+        # derived traces (rms, avg) are only calculated on first access (obj["CH1_rms"], obj.df or obj.compute())
+        if not lazy and not compact:
+            # decode (and filter) every trace now
+            self._filter_channels()
+            for channel in self.channels.values():
+                channel.values
+
+    @property
+    def df(self):
+        """ pandas DataFrame with all traces and requested rms/avg traces (decodes every trace when lazy)
+            time is not a column (unless time_column=True), use obj.time or obj.index_to_time() """
+        if self._df is None:
+            self._build_df()
+        return self._df
+
+    @df.setter
+    def df(self, value):
+        self._df = value
+
+    @property
+    def time(self):
+        """ time data of the traces, generated on every access out of the sample interval (xincr) """
+        return np.arange(len(self)) * self.xincr + self.xzero
+
+    def __len__(self):
+        """ number of samples per trace """
+        return len(next(iter(self.channels.values()))) if self.channels else 0
+
+    def index_to_time(self, index):
+        """ converts sample index (int or array) to time """
+        return np.asarray(index) * self.xincr + self.xzero
+
+    def time_to_index(self, time):
+        """ converts time (float or array) to the nearest sample index, clipped to the trace """
+        return np.clip(np.rint((np.asarray(time) - self.xzero) / self.xincr).astype(np.int64), 0, max(len(self) - 1, 0))
+
+    def decimate(self, n_out=2000, method="minmax", traces=None):
+        """
+        Plot-ready traces of (about) n_out samples
+
+        Args:
+            n_out (int): number of samples per decimated trace
+            method (str): "minmax" (min/max envelope, keeps spikes), "lttb" (largest-triangle-three-buckets) or "mean" (block mean)
+            traces (list): names of the traces (defaults to all traces of obj.df, or all channels when the dataframe isn't built)
+
+        Returns:
+            dict(name: [np.ndarray(time_data), np.ndarray(trace_data)])
+        """
+        if traces is None:
+            traces = [x for x in self._df.columns if x != "time"] if self._df is not None else self.get_trace_names()
+        res = dict()
+        for k in traces:
+            time_data, trace_data = decimate(self.xincr, np.asarray(self[k]), n_out, method)
+            res[k] = [time_data + self.xzero, trace_data]
+        return res
+
+    def cycle_stats(self, traces=None, reference=None, level=0.0, hysteresis=None):
+        """
+        Per-cycle statistics table: one row per mains cycle instead of one value per sample
+
+        Args:
+            traces (list): names of the traces (defaults to all channels)
+            reference (str): trace on which the cycles are detected (rising level crossings, defaults to the first trace),
+                all traces are summarized on the same cycles
+            level (float): crossing level of the reference trace
+            hysteresis (float): hysteresis around level (defaults to 10% of the peak-to-peak value of the reference)
+
+        Returns:
+            pd.DataFrame: index cycle, columns start, period, frequency + per trace {name}_rms, _mean, _peak, _min, _voltsec
+        """
+        traces = traces if traces else self.get_trace_names()
+        reference = reference if reference else traces[0]
+        crossings = find_cycles(np.asarray(self[reference]), level, hysteresis)
+        res = None
+        for k in traces:
+            stats = cycle_stats(self.xincr, np.asarray(self[k]), crossings)
+            if res is None:
+                res = stats[["start", "period", "frequency"]].copy()
+                res["start"] += self.xzero
+            for x in ["rms", "mean", "peak", "min", "voltsec"]:
+                res[f"{k}_{x}"] = stats[x]
+        return res
+
+    def power(self, voltage, current, order=40, level=0.0, hysteresis=None):
+        """
+        Power analysis of a voltage/current trace pair (see scope_power.PowerAnalysis)
+
+        Args:
+            voltage (str): name of the voltage trace
+            current (str): name of the current trace
+            order (int): highest harmonic of the FFT analysis
+            level (float), hysteresis (float): cycle detection on the voltage trace
+
+        Returns:
+            PowerAnalysis-object: .instantaneous, .cycles (per-cycle P, S, Q, PF, crest factors, THD), .harmonics(), .summary()
+        """
+        return PowerAnalysis(self.xincr, np.asarray(self[voltage]), np.asarray(self[current]), order, level, hysteresis, self.xzero)
+
+    # * EXPORT
+
+    def to_parquet(self, path, raw=False, row_group_size=1000000, compression="snappy"):
+        """
+        Stores the traces in a parquet file (one column per trace, time stays implicit), header information of
+        every trace and the sample interval are stored as file metadata
+
+        Args:
+            path (Path(Windows or Posix)): relative or absolute path of the file
+            raw (bool): store the raw adc codes + scaling instead of the physical values (and derived traces)
+            row_group_size (int): number of samples per row group (unit of a row range read)
+            compression (str): parquet compression codec
+        """
+        import pyarrow.parquet as pq
+        pq.write_table(self._to_arrow(raw), path, row_group_size=row_group_size, compression=compression)
+
+    def to_feather(self, path, raw=False, compression="uncompressed"):
+        """
+        Stores the traces in a feather (arrow ipc) file, uncompressed by default so it can be memory mapped
+        by from_feather(), see to_parquet() for the arguments
+        """
+        import pyarrow.feather as feather
+        feather.write_feather(self._to_arrow(raw), path, compression=compression)
+
+    def _to_arrow(self, raw):
+        """ return pyarrow.Table with one column per trace and the scopeparser metadata """
+        import pyarrow as pa
+        if raw:
+            # arrow only stores native byte order
+            columns = {k: np.asarray(v.codes, dtype=v.codes.dtype.newbyteorder("=")) for k, v in self.channels.items()}
+        else:
+            columns = {k: v.to_numpy() for k, v in self.df.drop(columns="time", errors="ignore").items()}
+        meta = {"version": PARSER_VERSION, "xincr": self.xincr, "xzero": self.xzero, "raw": raw, "channels": {
+            k: {"header": v.header, "mult": float(v.mult), "off": float(v.off), "zero": float(v.zero)}
+            for k, v in self.channels.items()}}
+        table = pa.table(columns)
+        return table.replace_schema_metadata({SCOPE_METADATA_KEY: json.dumps(meta)})
+
+    def __getitem__(self, key):
+        """ returns one trace, when lazy only this trace gets decoded, a derived trace ("CH1_rms") is only calculated for its channel """
+        if self._df is not None and key in self._df.columns:
+            return self._df[key]
+        elif key == "time":
+            return self.time
+        elif key in self.channels.keys():
+            return self.channels[key].values
+        name, _, suffix = str(key).rpartition("_")
+        if name in self.channels.keys() and suffix in DERIVED_FUNCTIONS.keys():
+            return self.derived(name, suffix)
+        return self.df[key]
+
+    def derived(self, name, suffix="rms", freq=None):
+        """
+        Derived trace of one channel, calculated on first access and memoized per (suffix, channel, freq)
+
+        Args:
+            name (str): name of the channel
+            suffix (str): "rms" (rms_calc) or "avg" (avg_calc)
+            freq (float): window frequency (defaults to rms_freq/averaging_freq of the object)
+
+        Returns:
+            np.ndarray
+        """
+        freq = freq if freq else self._freqs[suffix]
+        return self.compute([(suffix, [name], freq)])[f"{name}_{suffix}"]
+
+    def compute(self, requests=None):
+        """
+        Calculates a batch of derived traces that are not memoized yet, every (suffix, freq) in one vectorized pass
+        over the stacked (channels, samples) array of its channels
+
+        Args:
+            requests (list): [(suffix, channels or None (all), freq)] (defaults to the rms/avg traces requested at creation)
+
+        Returns:
+            dict(name_suffix: np.ndarray)
+        """
+        requests = self._derived if requests is None else requests
+        res = dict()
+        for suffix, cols, freq in requests:
+            if suffix not in DERIVED_FUNCTIONS.keys():
+                raise AttributeError(f"Unknown derived trace {suffix}, use one of {list(DERIVED_FUNCTIONS.keys())}")
+            names = [k for k in self.channels.keys() if cols is None or str(k) in cols]
+            todo = [k for k in names if (suffix, k, freq) not in self._memo.keys()]
+            if todo:
+                stacked = np.stack([np.asarray(self.channels[k].values, dtype=np.float64) for k in todo])
+                for k, values in zip(todo, DERIVED_FUNCTIONS[suffix](self.xincr, stacked, freq)):
+                    self._memo[(suffix, k, freq)] = values
+            for k in names:
+                res[f"{k}_{suffix}"] = self._memo[(suffix, k, freq)]
+        return res
+
+    def get_trace_names(self):
+        return list(self.channels.keys())
 
     # * PRIVATE METHODS
 
     # ISF
-    def _parse_isf(self, filename, time_parse=True):
-        f = open(f"{filename}", "rb")
-        header = []
-        data = []
-        chunk_reached = False
-        points_designator = False
-        nr_of_bits = 0
-        counter = 0
-        while True:
-            chunk = f.read(1)
-            if not chunk:
-                break
-            elif chunk_reached:
-                # chunked_reached becomes True upon seeing "#" in the datastream
-                if not points_designator:
-                    # first byte after "#" contains and int that describes how many bytes are refering to the size
-                    nr_of_bits = int(chunk.decode("utf8"))
-                    points_designator = True
-                else:
-                    if counter < nr_of_bits:
-                        # as long as the counter has not reached the nr_of_bits keep adding bytes to the info list
-                        header.append(chunk.decode("utf8"))
-                        counter += 1
-                    else:
-                        # everything else goes to the binary data list
-                        data.append(chunk)
-            elif chunk.decode("utf8", errors="ignore") == "#":
-                # # is the designator in the .isf that starts a sequence to decrypt the binary data
-                header.append(chunk.decode("utf8"))
-                chunk_reached = True
+    def _parse_isf(self, filename, lazy=False):
+        """ return ScopeChannel(isf_file)
+            lazy: memory map the file, only the header is parsed and the curve data is a zero-copy view """
+        with open(f"{filename}", "rb") as f:
+            if lazy:
+                raw = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
             else:
-                header.append(chunk.decode("utf8", "ignore"))
-        f.close()
-        header_list = "".join(header[:]).split(";")
+                raw = f.read()
+        header_list, offset, length = self._locate_isf_block(raw)
         header_dict = self._get_header_dict(header_list)
-        trace_data = self._parse_isf_data(data, header_dict)
-        if time_parse:
-            time_data = self._create_isf_time(trace_data, header_dict)
-            return [trace_data, time_data]
-        else:
-            return trace_data
+        codes = self._isf_codes(raw, header_dict, offset, length)
+        yzero = header_dict["YZERO"] if header_dict["YZERO"] else 0.0
+        channel = ScopeChannel(Path(filename).stem[-3:], codes, header_dict,
+                               header_dict["YMULT"], header_dict["YOFF"], yzero)
+        return channel
+
+    @staticmethod
+    def _locate_isf_block(raw, size=None):
+        """ return [header_list, offset, length]
+            finds the "#<n><len>" block designator: offset and length point to the binary curve data in raw
+            size: total size of the file when raw only contains its start (defaults to len(raw)) """
+        # "#" is the designator in the .isf that starts the binary block, everything before it is ascii header
+        start = raw.find(b"#")
+        if start < 0:
+            return ScopeParser._locate_isf_ascii(raw)
+        # first byte after "#" contains an int that describes how many bytes are refering to the size
+        nr_of_digits = int(raw[start + 1:start + 2])
+        offset = start + 2 + nr_of_digits
+        length = int(raw[start + 2:offset])
+        # never read past the end of the data (truncated file)
+        length = min(length, (size if size else len(raw)) - offset)
+        header_list = bytes(raw[:start]).decode("utf8", "ignore").split(";")
+        return [header_list, offset, length]
+
+    @staticmethod
+    def _locate_isf_ascii(raw):
+        """ return [header_list, offset, length] for ascii encoded curve data: "header;[:CURVE ]1,2,3,..." """
+        end = raw.rfind(b";")
+        if end < 0:
+            raise AttributeError("No curve data found in isf data")
+        offset = end + 1
+        # skip the (optional) curve keyword in front of the data
+        keyword = re.match(rb"\s*:?[A-Za-z:]+\s", bytes(raw[offset:offset + 64]))
+        if keyword:
+            offset += keyword.end()
+        header_list = bytes(raw[:end]).decode("utf8", "ignore").split(";")
+        return [header_list, offset, len(raw) - offset]
+
+    @staticmethod
+    def _isf_dtype(header_dict):
+        """ return np.dtype(one_sample) of binary curve data (RI: signed, RP: unsigned, FP: float) or None for ascii
+            curve data, raises AttributeError for sample layouts that are not supported (e.g. FP in 8 or 16 bit) """
+        if header_dict["ENCODING"] == "ASC":
+            return None
+        bn_fmt = header_dict["BINARY_FORMAT"] if header_dict["BINARY_FORMAT"] else "RI"
+        kind = ISF_BINARY_FORMATS.get(bn_fmt)
+        nr_bytes = header_dict["BYT_NR"]
+        if kind is None or nr_bytes not in [1, 2, 4, 8] or (kind == "f" and nr_bytes < 4):
+            raise AttributeError(f"Unsupported isf sample layout: BN_FMT {bn_fmt} with BYT_NR {nr_bytes}")
+        order = ">" if header_dict["BYT_OR"] == "MSB" else "<"
+        return np.dtype(f"{order}{kind}{nr_bytes}")
 
-    def _get_header_dict(self, header_list):
-        res = {"BYT_NR": None, "ENCODING": None, "BINARY_FORMAT": None, "BYT_OR": None, "BIT_NR": None, "WFID_channel": None, "WFID_coupling": None,
-               "WFID_y_scale_number": None, "WFID_y_scale_unit": None, "WFID_x_scale_number": None, "WFID_x_scale_unit": None, "WFID_number_of_points": None,
-               "NR_PT": None, "XINCR": None, "XZERO": None, "YMULT": None, "YOFF": None, "YZERO": None, "VSCALE": None, "HSCALE": None, "VPOS": None, "VOFFSET": None,
-               "HDELAY": None}
+    @classmethod
+    def _isf_codes(cls, raw, header_dict, offset, length):
+        """ return np.ndarray(raw_adc_codes)
+            zero-copy view on the binary block of raw (bytes, bytearray or mmap), ascii curve data is parsed """
+        if header_dict["ENCODING"] == "ASC":
+            return np.fromstring(bytes(raw[offset:offset + length]).decode("utf8", "ignore"), sep=",")
+        dtype = cls._isf_dtype(header_dict)
+        # an odd trailing byte can't form a 16 bit sample and is dropped
+        return np.frombuffer(raw, dtype=dtype, count=length // dtype.itemsize, offset=offset)
+
+    @classmethod
+    def _get_header_dict(cls, header_list):
+        """ return dict(header information)
+            single pass over the ;-separated WFMPRE fields, short and long keywords are looked up in ISF_KEYWORD_TABLE """
+        res = dict.fromkeys(ISF_HEADER_KEYS)
         for e in header_list:
-            res["BYT_NR"] = int(e[len(e)-1]) if "BYT_N" in e else res["BYT_NR"]
-            res["ENCODING"] = e[6:] if "ENCDG" in e else res["ENCODING"]
-            res["BINARY_FORMAT"] = e[7:] if "BN_FMT" in e else res["BINARY_FORMAT"]
-            res["BYT_OR"] = e[7:] if "BYT_OR" in e else e[6:] if "BYT_OR" in e else res["BYT_OR"]
-            if "BIT_N" in e:
-                x = ""
-                for i in range(len(e)-3, len(e)):
-                    if e[i].isnumeric():
-                        x = x + e[i]
-                res["BIT_NR"] = int(x)
-            if e.startswith("WFID"):
-                x = e.lstrip('WFID "').rstrip('"').split(",")
-                res["WFID_channel"] = x[0]
-                res["WFID_coupling"] = x[1][1:3]
-                temp = self._parse_isf_wfid(x[2])
-                res["WFID_y_scale_number"] = temp[0]
-                res["WFID_y_scale_unit"] = temp[1]
-                temp = self._parse_isf_wfid(x[3])
-                res["WFID_x_scale_number"] = temp[0]
-                res["WFID_x_scale_unit"] = temp[1]
-                if x[4].rstrip().endswith("points"):
-                    num = ""
-                    for i in x[4]:
-                        if i.isnumeric():
-                            num = num + i
-                    res["WFID_number_of_points"] = int(num)
-            if "NR_P" in e:
-                if ":" in e:
-                    pass
-                elif "NR_PT" in e:
-                    res["NR_PT"] = int(e[6:])
-                else:
-                    res["NR_PT"] = int(e[5:])
-            res["XINCR"] = float(e[6:]) if "XINCR" in e else float(
-                e[3:]) if "XIN" in e else res["XINCR"]
-            res["XZERO"] = float(e[6:]) if "XZERO" in e else res["XZERO"]
-            res["YMULT"] = float(e[6:]) if "YMULT" in e else float(
-                e[4:]) if "YMU" in e else res["YMULT"]
-            res["YOFF"] = float(e[5:]) if "YOFF" in e else float(
-                e[4:]) if "YOF" in e else res["YOFF"]
-            res["YZERO"] = float(e[6:]) if "YZERO" in e else res["YZERO"]
-            res["VSCALE"] = float(e[7:]) if "VSCALE" in e else res["VSCALE"]
-            res["HSCALE"] = float(e[7:]) if "HSCALE" in e else res["HSCALE"]
-            res["VPOS"] = float(e[5:]) if "VPOS" in e else res["VPOS"]
-            res["VOFFSET"] = float(e[8:]) if "VOFFSET" in e else res["VOFFSET"]
-            res["HDELAY"] = float(e[7:]) if "HDELAY" in e else res["HDELAY"]
+            field = e.strip().split(" ", 1)
+            if len(field) < 2:
+                continue
+            # ":WFMPRE:BYT_NR 2" and "BYT_N 2" both end up as keyword "BYT_NR"
+            keyword = field[0].split(":")[-1].upper()
+            if keyword not in ISF_KEYWORD_TABLE.keys():
+                continue
+            key, conversion = ISF_KEYWORD_TABLE[keyword]
+            value = field[1].strip().strip('"')
+            try:
+                res[key] = conversion(value)
+            except ValueError:
+                logging.info(f"header field not understood: {e}")
+                continue
+            if key == "WFID":
+                res.update(cls._parse_isf_wfid(value))
+        if res["BIT_NR"] is None and res["BYT_NR"]:
+            res["BIT_NR"] = res["BYT_NR"] * 8
+        elif res["BYT_NR"] is None and res["BIT_NR"]:
+            res["BYT_NR"] = res["BIT_NR"] // 8
         return res
 
-    def _parse_isf_wfid(self, arg):
-        t = arg.lstrip(" ").rstrip(" ")
-        number = ""
-        unit_string = ""
-        for x in t:
-            if x.isnumeric() or x == ".":
-                number = number + x
-            else:
-                unit_string = unit_string + x
-        unit = unit_string.split("/")[0]
-        return [float(number), unit]
-
-    def _parse_isf_data(self, data, header_dict):
-        """ return list(data_for_one_isf_file) """
-        ret_data = []
-        order = "big" if header_dict["BYT_OR"] == "MSB" else "little"
-        if header_dict["BIT_NR"] == 16:
-            if len(data) % 2 != 0:
-                print(f"needed to pop last char: {data.pop()}")
-            for i in range(0, len(data), 2):
-                sample = int.from_bytes(data[i]+data[i+1], order, signed=True)
-                ret_data.append(
-                    (sample - header_dict["YOFF"]) * header_dict["YMULT"])
-        elif header_dict["BIT_NR"] == 8:
-            for i in range(len(data)):
-                ret_data.append(((int.from_bytes(
-                    data[i], order, signed=True) - header_dict["YOFF"]) * header_dict["YMULT"]))
-        return ret_data
-
-    def _create_isf_time(self, data, header_dict):
-        """ return list(time_data)
-            returns the time data scale for this scope image """
-        # in principle you can use header_dict to retrieve number of sample however len(data) seems safer to be sure
-        return list(i * header_dict["XINCR"] for i in range(len(data)))
+    @staticmethod
+    def _parse_isf_wfid(wfid):
+        """ return dict(WFID_...) out of e.g. "Ch1, DC coupling, 2.0E0 V/div, 1.0E-3 s/div, 2500 points, Sample mode" """
+        res = dict()
+        x = [t.strip() for t in wfid.split(",")]
+        if len(x) < 5:
+            return res
+        res["WFID_channel"] = x[0]
+        res["WFID_coupling"] = x[1][:2]
+        for i, axis in [(2, "y"), (3, "x")]:
+            scale = WFID_SCALE.match(x[i])
+            if scale:
+                res[f"WFID_{axis}_scale_number"] = float(scale.group(1))
+                res[f"WFID_{axis}_scale_unit"] = scale.group(2)
+        points = WFID_POINTS.match(x[4])
+        if points:
+            res["WFID_number_of_points"] = int(points.group(1))
+        return res
 
     # ALB
-    def _parse_alb(self, basename):
+    def _parse_alb(self, basename, dtype=np.float64, decode=True):
         # declarations
         filename = str(basename) + ".alb"
-        header = []
         raw = None
 
         # opening .alb file for header information + data
         with open(filename, "rb") as file:
-            while True:
-                x = file.readline().decode("utf8").rstrip()
-                if "HEADER_END" in x:
-                    header.append(x)
-                    raw = file.read()
-                    break
-                else:
-                    header.append(x)
+            header = self._read_alb_header(file)
+            raw = file.read()
         alb_header = self._analyze_alb_header(header)
         channels = [alb_header[x]["name"] for x in range(len(alb_header))]
         # print(setup)
         # .txt setup data with self._alb_header
         # print(self._alb_header)
-        return self._analyze_alb_data(raw, alb_header, channels)
+        return self._analyze_alb_data(raw, alb_header, channels, dtype, decode)
 
-    def _analyze_alb_header(self, header):
+    @staticmethod
+    def _read_alb_header(file):
+        """ return list(header_lines), file is left at the start of the binary data """
+        header = []
+        while True:
+            line = file.readline()
+            x = line.decode("utf8").rstrip()
+            header.append(x)
+            if "HEADER_END" in x or not line:
+                return header
+
+    @staticmethod
+    def _analyze_alb_header(header):
         ret = []
         for x in header:
             if "TABLE_BEGIN" in x:
@@ -332,23 +778,52 @@ class ScopeParser():
                     temp_dict[s[0]] = s[1].rstrip()
         return ret
 
-    def _analyze_alb_data(self, data, header_dict, channels):
+    @staticmethod
+    def _alb_dtypes(header_dict):
+        """ return list(np.dtype(one_sample) per channel) """
+        dtypes = []
+        for x in header_dict:
+            if x["VALUE_BYTES"] not in ALB_DTYPES.keys():
+                raise AttributeError(
+                    f"Unsupported sample width in .alb: {x['VALUE_BYTES']} bytes ({x['WIDTH_BITS']} bits)")
+            dtypes.append(np.dtype(ALB_DTYPES[x["VALUE_BYTES"]]))
+        return dtypes
+
+    @classmethod
+    def _alb_codes(cls, data, header_dict):
+        """ return np.ndarray(raw_adc_codes) of shape (channels, NUM_ROWS) or list(np.ndarray(raw_adc_codes) per channel)
+            channels are stored as contiguous big-endian blocks, when all channels have the same layout
+            one (channels, NUM_ROWS) zero-copy view is returned """
+        dtypes = cls._alb_dtypes(header_dict)
+        rows = [x["NUM_ROWS"] for x in header_dict]
+        if len(set(dtypes)) == 1 and len(set(rows)) == 1:
+            return np.frombuffer(data, dtype=dtypes[0], count=len(rows) * rows[0]).reshape(len(rows), rows[0])
+        ret = []
+        offset = 0
+        for dtype, nr in zip(dtypes, rows):
+            ret.append(np.frombuffer(data, dtype=dtype, count=nr, offset=offset))
+            offset += nr * dtype.itemsize
+        return ret
+
+    def _analyze_alb_data(self, data, header_dict, channels, dtype=np.float64, decode=True):
+        """ return [dict(name: ScopeChannel), sample_interval]
+            decode: calculate the physical values of all channels right away, otherwise only the codes are kept """
+        codes = self._alb_codes(data, header_dict)
+        y_inc = np.array([x["Y_INC"] for x in header_dict])
+        y_org = np.array([x["Y_ORG"] for x in header_dict])
+        if not decode:
+            values = [None] * len(codes)
+        elif isinstance(codes, np.ndarray):
+            # one pass over all channels: scaling by broadcasting
+            values = np.multiply(codes, y_inc[:, None], dtype=dtype)
+            values += y_org[:, None]
+        else:
+            values = [np.multiply(codes[x], y_inc[x], dtype=dtype) + y_org[x] for x in range(len(codes))]
         ret_list = dict()
-        time_list = None
         for x in range(len(channels)):
-            temp_list = []
-            if header_dict[x]["WIDTH_BITS"] == 16:
-                for i in range(header_dict[x]["NUM_ROWS"]):
-                    start = (i*2 + x * header_dict[x]["NUM_ROWS"] * 2)
-                    stop = (i*2 + x * header_dict[x]["NUM_ROWS"] * 2) + 2
-                    # temp_list.append((int.from_bytes(data[start:stop], "big", signed=True) * header_dict[x]["Y_INC"] + header_dict[x]["Y_ORG"])*int(header_dict[x]["PROBE_SETUP"]))
-                    temp_list.append((int.from_bytes(
-                        data[start:stop], "big", signed=True) * header_dict[x]["Y_INC"] + header_dict[x]["Y_ORG"]))
-                if not time_list:
-                    time_list = list(
-                        x * header_dict[0]["X_INC"] for x in range(len(temp_list)))
-                ret_list[channels[x]] = temp_list
-        return [ret_list, time_list]
+            ret_list[channels[x]] = ScopeChannel(channels[x], codes[x], header_dict[x],
+                                                 mult=y_inc[x], zero=y_org[x], values=values[x])
+        return [ret_list, header_dict[0]["X_INC"]]
 
     def _analyze_alb_setup(self, setupfile):
         temp = []
@@ -387,15 +862,32 @@ class ScopeParser():
             FileNotFoundError("Setup file not saved")
         return ret
 
-    def _apply_func_in_df(self, func, cols, freq):
-        for k, v in self.df.drop("time", axis=1).items():
-            if cols == None:
-                k_new = k + "_rms"
-                self.df[k_new] = func(self.df.time, list(v), freq)
-            elif str(k) in cols:
-                k_new = k + "_rms"
-                self.df[k_new] = func(self.df.time, list(v), freq)
-
+    def _build_df(self):
+        # time is implicit (self.time), only added as a column on request
+        columns = {"time": self.time} if self._time_column else dict()
+        self._filter_channels()
+        for k, v in self.channels.items():
+            columns[k] = v.values
+        columns.update(self.compute())
+        # the dataframe is assembled once out of all columns (no column by column inserts)
+        self._df = pd.DataFrame(columns)
+
+    def _filter_channels(self):
+        """ decodes + alpha filters all traces that are not decoded yet as one (channels, samples) array in one call """
+        todo = [v for v in self.channels.values() if v.filt and v.cache and not v.is_decoded()]
+        if self._alpha is None or len(todo) < 2 or len(set(len(v) for v in todo)) > 1:
+            return
+        stacked = np.stack([v.physical(filtered=False) for v in todo])
+        filtered = first_order_filter(stacked, self._alpha)[0]
+        for channel, values in zip(todo, filtered):
+            channel._values = values
+
+
+def _load_capture(cls, entry_type, file, channels, args, kwargs):
+    """ worker function of ScopeParser.from_directory (module level so it can be used in a process pool) """
+    if entry_type == "isf":
+        return cls.from_isf(file, channels, *args, **kwargs)
+    return cls.from_alb(file, *args, **kwargs)
 
 def main():
     obj = calculate_time(ScopeParser.from_isf)(
@@ -1,6 +1,10 @@
 import pyvisa as visa
+import threading
 from pathlib import Path
 import matplotlib.pyplot as plt
+import numpy as np
+from scopeparser import ScopeParser
+from scope_channel import ScopeChannel
 
 CHANNELS = ["CH1", "CH2", "CH3", "CH4"]
 
@@ -9,6 +13,7 @@ class TekConnection():
     def __init__(self, resource_name, channels=CHANNELS):
         self.instr = visa.ResourceManager().open_resource(resource_name)
         self.channels = channels
+        self._writers = []
         print("connection opened: {}".format(self.instr.query("*IDN?")))
 
     def generate_isf(self, name):
@@ -25,6 +30,58 @@ class TekConnection():
                 f.write(data)
             print("done")
 
+    def acquire(self, save=None, encoding="RIB", *args, **kwargs):
+        """
+        Acquires the channels straight into a ScopeParser-object: binary transfer into NumPy arrays, no .isf round-trip
+
+        Args:
+            save (str): when given, every channel is also written to "{save}_{chan}.isf" in a background thread
+                (wait_saved() blocks until these are written)
+            encoding (str): data encoding of the transfer (RIB, RPB, SRI, SRP, FPB or ASCII)
+            other kwargs are passed to the ScopeParser-object (rms, avg, rename_dict, ...)
+
+        Returns:
+            ScopeParser-object
+        """
+        channels = dict()
+        for chan in self.channels:
+            self.instr.write(":DATA:ENC {}".format(encoding))
+            self.instr.write(f":DATA:SOURCE {chan}")
+            header = self.instr.query(":WFMPRE?").rstrip() + ";"
+            header_dict = ScopeParser._get_header_dict(header.split(";"))
+            dtype = ScopeParser._isf_dtype(header_dict)
+            if header_dict["ENCODING"] == "ASC":
+                codes = self.instr.query_ascii_values("CURV?", container=np.array)
+            else:
+                codes = self.instr.query_binary_values("CURV?", datatype=dtype.char, is_big_endian=dtype.byteorder == ">",
+                                                       container=np.array)
+            yzero = header_dict["YZERO"] if header_dict["YZERO"] else 0.0
+            channels[chan] = ScopeChannel(chan, codes, header_dict, header_dict["YMULT"], header_dict["YOFF"], yzero)
+            if save:
+                writer = threading.Thread(target=self._write_isf, args=(f"{save}_{chan}.isf", header, codes, dtype))
+                writer.start()
+                self._writers.append(writer)
+        xincr = next(iter(channels.values())).header["XINCR"]
+        return ScopeParser.from_dict(channels, xincr, *args, **kwargs)
+
+    def wait_saved(self):
+        """ blocks until all .isf files of acquire(save=...) are written """
+        for writer in self._writers:
+            writer.join()
+        self._writers = []
+
+    def _write_isf(self, filename, header, codes, dtype):
+        with open(filename, "wb") as f:
+            f.write(header.encode())
+            if dtype is None:
+                # ascii encoding: comma separated codes
+                f.write(":CURVE {}\n".format(",".join(str(x) for x in codes)).encode())
+                return
+            data = np.asarray(codes, dtype=dtype).tobytes()
+            length = str(len(data))
+            f.write(f"#{len(length)}{length}".encode())
+            f.write(data)
+
         # * SETTERS
 
     def set_encoding(self, res):